@@ -6,7 +6,11 @@ This is the main entry point for the application. The code is organized
 into separate modules for better maintainability and scalability.
 """
 
+import io
+import threading
+import time
 import streamlit as st
+from config import get_model, TEXT_MODEL_NAME
 from src.models.constants import MessageRole
 from src.services.chat_history import ChatHistoryManager
 from src.services.gemini_service import GeminiChatService
@@ -14,13 +18,50 @@ from src.services.response_handler import ResponseHandler
 from src.services.csv_service import CSVService
 from src.services.prompts import DataAnalystPrompts
 from src.services.prompt_analyzer import PromptAnalyzer
+from src.services.upload_cache import UploadCache
 from src.ui.chat import ChatUI
 from src.ui.sidebar import SidebarUI
 from logger_config import LoggerConfig, get_logger
 
+
+@st.cache_resource(show_spinner=False)
+def _init_logger():
+    """Set up logging once per process (Streamlit re-executes this script on every rerun)."""
+    LoggerConfig.setup_logging()
+    return get_logger(__name__)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_services():
+    """Create the stateless services once per process and share them across reruns."""
+    chat_service = GeminiChatService()
+    return chat_service, ResponseHandler(chat_service), ChatHistoryManager()
+
+
+@st.cache_resource(show_spinner=False)
+def _warm_up_gemini() -> None:
+    """
+    Send one tiny request in the background, once per process.
+    
+    The first Gemini call pays for connection setup and auth; doing it at
+    startup keeps that out of the first user's time-to-first-token. Both
+    models share the SDK's default client, so warming the lite model is enough.
+    """
+    def _ping():
+        try:
+            start = time.time()
+            get_model(TEXT_MODEL_NAME, with_code_exec=False).generate_content(
+                "ping", generation_config={"max_output_tokens": 1}
+            )
+            logger.info("Gemini connection warmed up in %.2fs", time.time() - start)
+        except Exception as e:
+            logger.warning("Gemini warm-up request failed: %s", e)
+    
+    threading.Thread(target=_ping, name="gemini-warmup", daemon=True).start()
+
+
 # Initialize logging
-LoggerConfig.setup_logging()
-logger = get_logger(__name__)
+logger = _init_logger()
 
 
 class ChatbotApp:
@@ -34,11 +75,10 @@ class ChatbotApp:
     
     def __init__(self):
         """Initialize the chatbot application with all required services."""
-        logger.info("Initializing ChatbotApp")
-        self.chat_service = GeminiChatService()
-        self.response_handler = ResponseHandler(self.chat_service)
-        self.history_manager = ChatHistoryManager()
-        logger.info("ChatbotApp initialized successfully")
+        logger.debug("Initializing ChatbotApp")
+        self.chat_service, self.response_handler, self.history_manager = _get_services()
+        _warm_up_gemini()
+        logger.debug("ChatbotApp initialized successfully")
     
     def run(self) -> None:
         """
@@ -56,15 +96,16 @@ class ChatbotApp:
         ChatUI.configure_page()
         self.history_manager.initialize()
         
-        # Main UI
+        # Main UI (messages is the live history list, so it reflects messages added below)
+        messages = self.history_manager.get_messages()
         ChatUI.render_header()
-        ChatUI.render_messages(self.history_manager.get_messages())
+        ChatUI.render_messages(messages)
         
         # Handle user input
         self._handle_user_input()
         
         # Sidebar
-        SidebarUI.render(self.history_manager.get_message_count())
+        SidebarUI.render(len(messages))
     
     def _handle_user_input(self) -> None:
         """
@@ -78,7 +119,7 @@ class ChatbotApp:
         5. Handle optional CSV data (via file upload to Gemini)
         """
         if prompt := ChatUI.get_user_input():
-            logger.info(f"User submitted message (length: {len(prompt)} chars)")
+            logger.info("User submitted message (length: %d chars)", len(prompt))
             
             # Check if there's an uploaded image
             uploaded_image = st.session_state.get('uploaded_image', None)
@@ -88,119 +129,159 @@ class ChatbotApp:
             # Check if there's a loaded CSV DataFrame
             df = st.session_state.get('df', None)
             uploaded_csv_file = None
+            upload_future = None
+            csv_cache_name = None
             
             if df is not None:
-                logger.info(f"[REQUEST] CSV present: {df.shape[0]} rows × {df.shape[1]} cols")
+                df_fingerprint = CSVService.get_session_fingerprint(df)
                 
-                # Validate token limits before uploading
-                import time
-                validate_start = time.time()
-                test_prompt = DataAnalystPrompts.get_file_upload_prompt(prompt)
-                validation = CSVService.validate_token_limit(df, test_prompt)
-                validate_time = time.time() - validate_start
-                logger.info(f"[REQUEST] Token validation: {validate_time:.2f}s - {validation['message']}")
-                
-                if not validation['is_valid']:
-                    logger.warning(f"[REQUEST] Token limit exceeded: {validation['estimated_total_tokens']:,} tokens")
-                    st.error(f"❌ **Token Limit Exceeded**\n\n{validation['message']}\n\n"
-                            "Reduce dataset size by filtering rows or removing columns.")
-                    return
-                
-                if validation['estimated_total_tokens'] > 500_000:
-                    st.info(f"ℹ️ Large dataset - {validation['message']}")
+                # Validate token limits before uploading (CSV estimate reused while data is unchanged)
+                file_upload_prompt = DataAnalystPrompts.get_file_upload_prompt(prompt)
+                if CSVService.is_small_csv(df, df_fingerprint, file_upload_prompt):
+                    logger.info("[REQUEST] CSV %d rows × %d cols - token validation skipped (small dataset)",
+                                df.shape[0], df.shape[1])
+                else:
+                    validate_start = time.time()
+                    validation = CSVService.validate_token_limit(
+                        df, file_upload_prompt, csv_tokens=CSVService.get_token_estimate(df, df_fingerprint)
+                    )
+                    validate_time = time.time() - validate_start
+                    logger.info("[REQUEST] CSV %d rows × %d cols - token validation: %.2fs - %s",
+                                df.shape[0], df.shape[1], validate_time, validation['message'])
+                    
+                    if not validation['is_valid']:
+                        logger.warning("[REQUEST] Token limit exceeded: %d tokens",
+                                       validation['estimated_total_tokens'])
+                        st.error(f"❌ **Token Limit Exceeded**\n\n{validation['message']}\n\n"
+                                "Reduce dataset size by filtering rows or removing columns.")
+                        return
+                    
+                    if validation['estimated_total_tokens'] > 500_000:
+                        st.info(f"ℹ️ Large dataset - {validation['message']}")
                 
-                # Upload CSV to Gemini
-                if 'uploaded_csv_file' not in st.session_state or st.session_state.get('csv_changed', True):
-                    logger.info("[REQUEST] Uploading CSV to Gemini...")
-                    uploaded_csv_file = CSVService.upload_csv_to_gemini(df)
-                    if uploaded_csv_file:
-                        st.session_state['uploaded_csv_file'] = uploaded_csv_file
-                        st.session_state['csv_changed'] = False
-                        logger.info("[REQUEST] CSV upload successful")
-                    else:
-                        logger.error("[REQUEST] CSV upload failed")
+                # Upload CSV to Gemini (skipped when this exact data was already uploaded).
+                # A new upload runs in the background while the user message is stored and shown.
+                cached_file = st.session_state.get('uploaded_csv_file')
+                if cached_file and st.session_state.get('uploaded_csv_hash') == df_fingerprint:
+                    uploaded_csv_file = cached_file
+                    logger.info("[REQUEST] Using cached uploaded file: %s", uploaded_csv_file.name)
+                elif st.session_state.get('upload_future_hash') == df_fingerprint:
+                    # Upload was already started when the CSV was loaded in the sidebar
+                    upload_future = st.session_state['upload_future']
+                    logger.info("[REQUEST] Using CSV upload started at load time")
                 else:
-                    uploaded_csv_file = st.session_state.get('uploaded_csv_file')
-                    logger.info(f"[REQUEST] Using cached uploaded file: {uploaded_csv_file.name if uploaded_csv_file else 'None'}")
+                    logger.info("[REQUEST] Uploading CSV to Gemini...")
+                    upload_future = CSVService.upload_csv_to_gemini_async(df)
             
             # Determine if user is requesting a plot/visualization
             requires_plot = PromptAnalyzer.requires_plot(prompt)
             
-            # Prepare enhanced prompt based on context
-            enhanced_prompt = prompt
+            # Convert uploaded image to bytes for storage if present
+            image_bytes = None
+            if uploaded_image:
+                img_byte_arr = io.BytesIO()
+                uploaded_image.save(img_byte_arr, format=uploaded_image.format or 'PNG')
+                image_bytes = img_byte_arr.getvalue()
+            
+            # Store user message with timestamp and image (original prompt, not enhanced)
+            last_message = self.history_manager.add_message(MessageRole.USER.value, prompt, image=image_bytes)
+            
+            # Display user message with timestamp and image in a single chat bubble
+            user_message_container = ChatUI.display_message(
+                MessageRole.USER.value, 
+                prompt,
+                last_message.get("timestamp"),
+                image=uploaded_image
+            )
+            
+            # Wait for a background CSV upload to finish and be processed by Gemini
+            if upload_future is not None:
+                uploaded_csv_file = CSVService.wait_for_processing(upload_future.result())
+                st.session_state.pop('upload_future', None)
+                st.session_state.pop('upload_future_hash', None)
+                if uploaded_csv_file:
+                    st.session_state['uploaded_csv_file'] = uploaded_csv_file
+                    st.session_state['uploaded_csv_hash'] = df_fingerprint
+                    logger.info("[REQUEST] CSV upload successful")
+                else:
+                    logger.error("[REQUEST] CSV upload failed")
             
-            # Check for CSV upload failure first
+            # If there's CSV data, add an indicator to the user's chat bubble
+            if df is not None:
+                with user_message_container:
+                    upload_status = "📤 File uploaded to Gemini" if uploaded_csv_file else "⚠️ Upload failed"
+                    st.caption(f"{upload_status}: {df.shape[0]:,} rows × {df.shape[1]} columns")
+            
+            # Check for CSV upload failure
             if df is not None and not uploaded_csv_file:
                 logger.error("[REQUEST] CSV present but upload failed")
-                st.error("❌ Upload failed - please reload the CSV file")
+                error_message = "❌ Upload failed - please reload the CSV file or try a smaller file"
+                # Answer the stored user message, so the history keeps alternating user/model turns
+                with st.chat_message(MessageRole.ASSISTANT.value):
+                    ChatUI.display_error(error_message)
+                self.history_manager.add_message(MessageRole.ASSISTANT.value, error_message)
                 return
             
-            # Determine prompt based on whether plot is needed and CSV is present
+            # Cache the uploaded file + static instructions so follow-up turns only send the question
+            if uploaded_csv_file:
+                csv_cache_expired = time.time() >= st.session_state.get('csv_cache_expires', 0)
+                if st.session_state.get('csv_cache_hash') != df_fingerprint or csv_cache_expired:
+                    # A failed attempt is remembered too, so it isn't retried on every turn
+                    st.session_state['csv_cache_name'] = CSVService.create_context_cache(
+                        uploaded_csv_file,
+                        DataAnalystPrompts.FILE_UPLOAD_CONTEXT
+                    )
+                    st.session_state['csv_cache_hash'] = df_fingerprint
+                    # Renew slightly before Gemini drops the cache
+                    st.session_state['csv_cache_expires'] = time.time() + CSVService.CONTEXT_CACHE_TTL_SECONDS - 30
+                csv_cache_name = st.session_state.get('csv_cache_name')
+            
+            # Prepare enhanced prompt based on whether plot is needed and CSV is present
             if requires_plot:
                 # User wants a plot (works with or without CSV)
                 enhanced_prompt = DataAnalystPrompts.get_plot_prompt(prompt)
-                logger.info("[REQUEST] Using plot prompt")
+                prompt_kind = "plot"
+            elif csv_cache_name:
+                # CSV analysis without plot, file and instructions already cached
+                enhanced_prompt = DataAnalystPrompts.get_cached_file_prompt(prompt)
+                prompt_kind = "cached CSV analysis"
             elif uploaded_csv_file:
-                # CSV analysis without plot
-                enhanced_prompt = DataAnalystPrompts.get_file_upload_prompt(prompt)
-                logger.info("[REQUEST] Using CSV analysis prompt")
-            # else: use original prompt as-is
+                # CSV analysis without plot (same prompt that was token-validated above)
+                enhanced_prompt = file_upload_prompt
+                prompt_kind = "CSV analysis"
+            else:
+                # Use original prompt as-is
+                enhanced_prompt = prompt
+                prompt_kind = "plain"
             
-            logger.info(f"[REQUEST] Sending to AI - User prompt: '{prompt[:100]}...'")
+            # An image that stays attached across turns is uploaded once, then sent by reference
+            # (only the regular chat path sends images)
+            image_for_ai = uploaded_image
+            if uploaded_image and not uploaded_csv_file:
+                image_for_ai = UploadCache.resolve(image_bytes, uploaded_image)
             
-            # Convert uploaded image to bytes for storage if present
-            image_bytes = None
-            if uploaded_image:
-                import io
-                img_byte_arr = io.BytesIO()
-                uploaded_image.save(img_byte_arr, format=uploaded_image.format or 'PNG')
-                image_bytes = img_byte_arr.getvalue()
-            
-            # Store user message with timestamp and image (original prompt, not enhanced)
-            self.history_manager.add_message(MessageRole.USER.value, prompt, image=image_bytes)
-            
-            # Get the last message (just added) to display with timestamp
-            messages = self.history_manager.get_messages()
-            last_message = messages[-1] if messages else None
-            
-            # Display user message with timestamp
-            if last_message:
-                ChatUI.display_message(
-                    MessageRole.USER.value, 
-                    prompt,
-                    last_message.get("timestamp")
-                )
-                
-                # If there's an image, display it in the chat
-                if uploaded_image:
-                    with st.chat_message(MessageRole.USER.value):
-                        st.image(uploaded_image, caption="Uploaded Image", width='stretch')
-                
-                # If there's CSV data, show indicator in chat
-                if df is not None:
-                    with st.chat_message(MessageRole.USER.value):
-                        upload_status = "📤 File uploaded to Gemini" if uploaded_csv_file else "⚠️ Upload failed"
-                        st.caption(f"{upload_status}: {df.shape[0]:,} rows × {df.shape[1]} columns")
+            logger.info("[REQUEST] Sending to AI - %s prompt, %s handler - User prompt: '%.100s...'",
+                        prompt_kind, "plot-aware" if requires_plot else "streaming", prompt)
             
             # Generate and display AI response
             if requires_plot:
-                logger.info("[REQUEST] Using plot-aware response handler")
                 self.response_handler.handle_response_with_plots(
                     enhanced_prompt,
-                    image=uploaded_image,
-                    uploaded_file_ref=uploaded_csv_file
+                    image=image_for_ai,
+                    uploaded_file_ref=uploaded_csv_file,
+                    question=prompt
                 )
             else:
-                logger.info("[REQUEST] Using streaming response handler")
                 self.response_handler.handle_response(
                     enhanced_prompt,
-                    image=uploaded_image,
-                    uploaded_file_ref=uploaded_csv_file
+                    image=image_for_ai,
+                    uploaded_file_ref=uploaded_csv_file,
+                    cached_content=csv_cache_name,
+                    question=prompt
                 )
             
             # Clear the image from session state after processing
-            if uploaded_image and 'uploaded_image' in st.session_state:
-                del st.session_state['uploaded_image']
+            if uploaded_image and st.session_state.pop('uploaded_image', None) is not None:
                 logger.info("Cleared uploaded image from session state")
 
 
@@ -208,10 +289,11 @@ def main() -> None:
     """
     Application entry point.
     
-    Creates and runs the chatbot application instance.
+    Creates the chatbot application and runs it. The app is rebuilt on every
+    rerun (its services are cached resources), so edited code takes effect
+    without restarting the session.
     """
-    app = ChatbotApp()
-    app.run()
+    ChatbotApp().run()
 
 
 if __name__ == "__main__":
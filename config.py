@@ -4,9 +4,11 @@ Handles environment variables and API initialization.
 """
 
 import os
+from functools import lru_cache
+import streamlit as st
 from dotenv import load_dotenv
 import google.generativeai as genai
-from google.genai import types
+from google.genai import Client, types
 
 # Load environment variables from .env file
 load_dotenv()
@@ -46,19 +48,60 @@ IMPORTANT - CODE VISIBILITY:
 VERIFICATION IS MANDATORY:
 Always verify your answers before presenting them. Never give multiple attempts or corrections - get it right the first time through proper code execution and verification."""
 
-# Initialize the Gemini model for vision and text
+# Export model names (MODEL_NAME is also used with the new genai.Client() API)
+MODEL_NAME = 'gemini-2.5-flash'
+TEXT_MODEL_NAME = 'gemini-2.5-flash-lite'
+
+
+# Initialize Gemini models for vision and text
 # Supports text, images, up to 1 million tokens, and code execution
-model = genai.GenerativeModel(
-    'gemini-2.5-flash',
-    tools='code_execution',  # Enable code execution for plot generation
-    system_instruction=SYSTEM_INSTRUCTION
-)
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_model(model_name: str = MODEL_NAME, with_code_exec: bool = True) -> genai.GenerativeModel:
+    """
+    Build a Gemini model once per process and share it across sessions.
+    
+    Args:
+        model_name: Gemini model name
+        with_code_exec: Enable code execution (for plot generation) and the data analyst system instruction
+        
+    Returns:
+        Shared GenerativeModel instance
+    """
+    if not with_code_exec:
+        return genai.GenerativeModel(model_name)
+    return genai.GenerativeModel(
+        model_name,
+        tools='code_execution',  # Enable code execution for plot generation
+        system_instruction=SYSTEM_INSTRUCTION
+    )
 
-# Also provide a flash lite model for faster responses
-text_model = genai.GenerativeModel('gemini-2.5-flash-lite')
 
-# Export model name for use with new genai.Client() API
-MODEL_NAME = 'gemini-2.5-flash'
+@lru_cache(maxsize=None)
+def get_genai_client() -> Client:
+    """
+    Build the google.genai client (file uploads, context caches) once per process.
+    
+    Plain lru_cache rather than st.cache_resource, since uploads call this
+    from background threads. The client is safe to share between threads.
+    
+    Returns:
+        Shared genai Client instance
+    """
+    return Client(api_key=GOOGLE_API_KEY)
+
+
+def __getattr__(name: str):
+    """Resolve the legacy `model` / `text_model` module attributes lazily."""
+    if name == "model":
+        return get_model()
+    if name == "text_model":
+        # Flash lite model for faster responses
+        return get_model(TEXT_MODEL_NAME, with_code_exec=False)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Embedding model used to pick older chat messages relevant to the current question
+EMBEDDING_MODEL = 'models/text-embedding-004'
 
 # Export generation config for file upload API (with code execution)
 # Note: genai.Client() uses different format than genai.GenerativeModel()
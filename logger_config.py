@@ -4,10 +4,24 @@ Logging configuration for the chatbot application.
 
 import logging
 import os
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 
+class _ListenerQueueHandler(QueueHandler):
+    """Queue handler that stops its listener thread (writing out queued records) when closed."""
+    
+    listener = None
+    
+    def close(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
 class LoggerConfig:
     """Centralized logging configuration."""
     
@@ -40,23 +54,32 @@ class LoggerConfig:
         log_filename = f"chatbot_{datetime.now().strftime('%Y%m%d')}.log"
         log_filepath = LoggerConfig.LOG_DIR / log_filename
         
+        # File handler - logs everything. Records are queued and written by a
+        # background listener thread, so logging never blocks on disk IO.
+        file_handler = logging.FileHandler(log_filepath, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(LoggerConfig.LOG_FORMAT, LoggerConfig.DATE_FORMAT))
+        log_queue = queue.Queue(-1)
+        queue_handler = _ListenerQueueHandler(log_queue)
+        # Only merge args into the message here; the file handler applies LOG_FORMAT
+        queue_handler.setFormatter(logging.Formatter())
+        # The listener is stopped when logging.shutdown() closes the queue handler at
+        # exit. That runs after the other atexit hooks (logging registers it on import),
+        # so records logged while flushing sessions at exit still reach the file.
+        queue_handler.listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        queue_handler.listener.start()
+        
+        # Console handler - only warnings and above (low volume, written directly)
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.WARNING)
+        
         # Configure root logger
         logging.basicConfig(
             level=log_level,
             format=LoggerConfig.LOG_FORMAT,
             datefmt=LoggerConfig.DATE_FORMAT,
-            handlers=[
-                # File handler - logs everything
-                logging.FileHandler(log_filepath, encoding='utf-8'),
-                # Console handler - only warnings and above
-                logging.StreamHandler()
-            ]
+            handlers=[queue_handler, console_handler]
         )
         
-        # Set console handler to WARNING level
-        console_handler = logging.getLogger().handlers[1]
-        console_handler.setLevel(logging.WARNING)
-        
         # Log startup
         logger = logging.getLogger(__name__)
         logger.info("=" * 60)
@@ -1,23 +1,36 @@
 """
 Source package initialization.
+
+Exports are loaded lazily on first access, so importing a single submodule
+(e.g. src.services.csv_service) doesn't pull in every service and UI module.
 """
 
-from .models.constants import MessageRole, AppConfig
-from .models.message import ChatMessage, GeminiMessage
-from .services.chat_history import ChatHistoryManager
-from .services.gemini_service import GeminiChatService
-from .services.response_handler import ResponseHandler
-from .ui.chat import ChatUI
-from .ui.sidebar import SidebarUI
-
-__all__ = [
-    'MessageRole',
-    'AppConfig',
-    'ChatMessage',
-    'GeminiMessage',
-    'ChatHistoryManager',
-    'GeminiChatService',
-    'ResponseHandler',
-    'ChatUI',
-    'SidebarUI',
-]
+import importlib
+
+_LAZY_IMPORTS = {
+    'MessageRole': '.models.constants',
+    'AppConfig': '.models.constants',
+    'ChatMessage': '.models.message',
+    'GeminiMessage': '.models.message',
+    'ChatHistoryManager': '.services.chat_history',
+    'GeminiChatService': '.services.gemini_service',
+    'ResponseHandler': '.services.response_handler',
+    'ChatUI': '.ui.chat',
+    'SidebarUI': '.ui.sidebar',
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name: str):
+    """Import an exported name from its submodule on first access."""
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """Include the lazy exports in dir(src)."""
+    return sorted(list(globals()) + __all__)
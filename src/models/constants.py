@@ -2,6 +2,7 @@
 Constants and enums used throughout the application.
 """
 
+import os
 from enum import Enum
 
 
@@ -24,8 +25,53 @@ class AppConfig:
     DEFAULT_PROMPT = "Ask me anything..."
     THINKING_MESSAGE = "Thinking..."
     GENERATING_MESSAGE = "Generating response..."
-    COMPLETE_MESSAGE = "Complete!"
-    ERROR_MESSAGE = "Error occurred"
+    
+    # Minimum seconds between UI redraws while a response is streaming
+    STREAM_RENDER_INTERVAL = 0.05
+    
+    # Streamed chunks received ahead of the one being displayed
+    STREAM_PREFETCH_CHUNKS = 2
+    
+    # Streamed chunks longer than this are re-chunked into MICRO_CHUNK-sized pieces,
+    # paced MICRO_CHUNK_DELAY seconds apart (at most SMOOTH_STREAM_MAX_DELAY per chunk)
+    SMOOTH_STREAM_THRESHOLD = 50
+    MICRO_CHUNK = 4
+    MICRO_CHUNK_DELAY = 0.02
+    SMOOTH_STREAM_MAX_DELAY = 0.25
+    
+    # Chat history sent to Gemini: the last HISTORY_WINDOW messages, plus older
+    # exchanges whose embedding similarity to the question reaches the threshold
+    HISTORY_WINDOW = 8
+    HISTORY_RELEVANCE_THRESHOLD = 0.75
+    
+    # Maximum messages kept per session (oldest are dropped first)
+    MAX_HISTORY_MESSAGES = 200
+    
+    # Answers about an uploaded CSV are reused for the same question (normalized text)
+    # about the same uploaded file, keeping the last few per file. Opt-in: also reuse
+    # them for questions at least this similar (cosine similarity of their embeddings);
+    # off by default, since "max of sales" and "min of sales" embed almost identically
+    SEMANTIC_CACHE_ENABLED = False
+    SEMANTIC_CACHE_THRESHOLD = 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES = 64
+    
+    # Opt-in: chat answers reused for an identical prompt and history within the same
+    # session (text-only follow-ups, never first turns), saved to CHAT_CACHE_FILE at exit.
+    # Off by default, since asking again usually means wanting a fresh answer.
+    CHAT_CACHE_ENABLED = False
+    CHAT_CACHE_MAX_ENTRIES = 64
+    CHAT_CACHE_TTL_SECONDS = 24 * 3600
+    CHAT_CACHE_FILE = os.path.join(".cache", "chat_responses.msgpack")
+    
+    # Background threads rendering and uploading CSVs to Gemini, shared by all
+    # sessions (a worker is only held for the upload, not while Gemini processes it)
+    UPLOAD_MAX_WORKERS = 8
+    
+    # Uploaded images are downscaled to at most this many pixels per side
+    # before they are kept in the session, shown, stored and sent to Gemini
+    IMAGE_MAX_SIDE = 1024
+    # The sidebar preview is encoded at most this size (sidebar width on high-DPI screens)
+    IMAGE_PREVIEW_SIDE = 640
     
     # Error Messages
     API_ERROR_TEMPLATE = (
@@ -34,5 +80,5 @@ class AppConfig:
     )
     
     # Plot Configuration
-    PLOT_MIME_TYPES = ["image/png", "image/jpeg"]
+    PLOT_MIME_TYPES = frozenset({"image/png", "image/jpeg"})
     EXECUTABLE_CODE_MIME_TYPE = "text/x.executable"
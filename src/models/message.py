@@ -2,17 +2,33 @@
 Data models for the chatbot application.
 """
 
+import time
 from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 from datetime import datetime
 
 
+class _TimestampCache:
+    """Last formatted timestamp, reused while the wall-clock second is unchanged."""
+    last_second = None
+    last_text = ""
+
+
+def current_timestamp() -> str:
+    """Format the current local time the way message timestamps are stored."""
+    now = int(time.time())
+    if now != _TimestampCache.last_second:
+        _TimestampCache.last_text = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        _TimestampCache.last_second = now
+    return _TimestampCache.last_text
+
+
 @dataclass
 class ChatMessage:
     """Represents a single message in the chat."""
     role: str
     content: str
-    timestamp: Optional[str] = None
+    timestamp: str = field(default_factory=current_timestamp)
     plots: Optional[List[bytes]] = field(default_factory=list)
     image: Optional[bytes] = None
     
@@ -21,7 +37,7 @@ class ChatMessage:
         return {
             "role": self.role, 
             "content": self.content,
-            "timestamp": self.timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp": self.timestamp,
             "plots": self.plots or [],
             "image": self.image
         }
@@ -32,7 +48,7 @@ class ChatMessage:
         return cls(
             role=data["role"], 
             content=data["content"],
-            timestamp=data.get("timestamp"),
+            timestamp=data.get("timestamp") or current_timestamp(),
             plots=data.get("plots", []),
             image=data.get("image")
         )
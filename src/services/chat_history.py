@@ -2,20 +2,39 @@
 Chat history management service.
 """
 
+import numpy as np
 import streamlit as st
 from typing import List, Dict, Optional
-from ..models.message import ChatMessage
+from ..models.constants import MessageRole, AppConfig
+from ..models.message import current_timestamp
+from .embedding_service import EmbeddingService
 from .persistence_service import PersistenceService
+from .upload_cache import UploadCache
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
+# Role strings, resolved from the enum once instead of on every message
+_USER_ROLE = MessageRole.USER.value
+_MODEL_ROLE = MessageRole.MODEL.value
+
+# Chat role -> Gemini role (Gemini only knows "user" and "model")
+_ROLE_MAP = {
+    _USER_ROLE: _USER_ROLE,
+    MessageRole.ASSISTANT.value: _MODEL_ROLE,
+    _MODEL_ROLE: _MODEL_ROLE,
+}
+
 
 class ChatHistoryManager:
     """Manages chat history stored in Streamlit session state with file persistence."""
     
     SESSION_KEY = "messages"
     SESSION_ID_KEY = "session_id"
+    SESSION_KEY_GEMINI = "gemini_messages"
+    WINDOW_START_KEY = "history_window_start"
+    # Messages dropped by the history cap since the session file was last rewritten
+    DROPPED_KEY = "history_dropped"
     
     @staticmethod
     def initialize() -> None:
@@ -25,8 +44,8 @@ class ChatHistoryManager:
         
         # Check if this is a fresh session (after page refresh)
         if ChatHistoryManager.SESSION_KEY not in st.session_state:
-            # Try to load the most recent session
-            sessions = PersistenceService.list_sessions()
+            # Try to load the most recent session (only its header is read)
+            sessions = PersistenceService.list_sessions(limit=1)
             
             if sessions:
                 # Load the most recent session (sessions are sorted newest first)
@@ -35,6 +54,11 @@ class ChatHistoryManager:
                 loaded_messages = PersistenceService.load_session(session_id)
                 
                 if loaded_messages:
+                    # Apply the history cap to sessions saved before it was reached, and shrink their file
+                    dropped = ChatHistoryManager._trim_history(loaded_messages)
+                    if dropped:
+                        logger.info(f"History limit reached - dropped {dropped} oldest restored message(s)")
+                        PersistenceService.save_session(session_id, loaded_messages)
                     st.session_state[ChatHistoryManager.SESSION_KEY] = loaded_messages
                     st.session_state[ChatHistoryManager.SESSION_ID_KEY] = session_id
                     logger.info(f"Restored most recent session: {session_id} ({len(loaded_messages)} messages)")
@@ -45,6 +69,13 @@ class ChatHistoryManager:
                 # No existing sessions, create new
                 ChatHistoryManager._create_new_session()
         
+        # Build the Gemini-format history once (e.g. after a restore); add_message keeps it in step
+        if ChatHistoryManager.SESSION_KEY_GEMINI not in st.session_state:
+            st.session_state[ChatHistoryManager.SESSION_KEY_GEMINI] = [
+                ChatHistoryManager._to_gemini_format(msg)
+                for msg in st.session_state[ChatHistoryManager.SESSION_KEY]
+            ]
+        
         # Ensure session ID exists
         if ChatHistoryManager.SESSION_ID_KEY not in st.session_state:
             session_id = PersistenceService.generate_session_id()
@@ -64,7 +95,67 @@ class ChatHistoryManager:
         return messages
     
     @staticmethod
-    def add_message(role: str, content: str, plots: Optional[List[bytes]] = None, image: Optional[bytes] = None) -> None:
+    def get_gemini_messages() -> List[Dict]:
+        """
+        Get the chat history in Gemini API format.
+        
+        Returns:
+            List of {'role', 'parts'} dictionaries, one per message in the chat history
+        """
+        return st.session_state.get(ChatHistoryManager.SESSION_KEY_GEMINI, [])
+    
+    @staticmethod
+    def get_relevant_messages(k: int = AppConfig.HISTORY_WINDOW) -> List[Dict]:
+        """
+        Get the Gemini-format history to send with the current question.
+        
+        Keeps a window of recent messages, plus any older user/model exchange
+        whose embedding is similar enough to the current question (the last
+        message). If embeddings can't be computed, only the window is kept.
+        
+        The window start is sticky: the window grows turn by turn and only
+        moves up (back to k messages) once it exceeds 2k. Consecutive requests
+        therefore share the same leading history, which Gemini's implicit
+        prompt caching can reuse.
+        
+        Args:
+            k: Minimum number of recent messages included (kept even, so exchanges stay paired)
+            
+        Returns:
+            List of messages in Gemini format, ending with the current question
+        """
+        history = ChatHistoryManager.get_gemini_messages()
+        window_start = st.session_state.get(ChatHistoryManager.WINDOW_START_KEY, 0)
+        if len(history) - 1 - window_start > 2 * k:
+            window_start = len(history) - 1 - k
+            st.session_state[ChatHistoryManager.WINDOW_START_KEY] = window_start
+        if window_start <= 0:
+            return history
+        
+        older = history[:window_start]
+        exchanges = [older[i:i + 2] for i in range(0, len(older), 2)]
+        try:
+            query, *candidates = EmbeddingService.embed_texts(
+                [history[-1]["parts"][0]] + ["\n".join(m["parts"][0] for m in ex) for ex in exchanges]
+            )
+        except Exception as e:
+            logger.warning(f"Relevance filter unavailable, sending last {k} messages only: {str(e)}")
+            return history[window_start:]
+        
+        query = np.asarray(query)
+        relevant = []
+        for exchange, embedding in zip(exchanges, candidates):
+            embedding = np.asarray(embedding)
+            similarity = float(query @ embedding / (np.linalg.norm(query) * np.linalg.norm(embedding) or 1.0))
+            if similarity >= AppConfig.HISTORY_RELEVANCE_THRESHOLD:
+                relevant.extend(exchange)
+        
+        logger.info(f"History for Gemini: {len(relevant)} relevant older + {len(history) - window_start} recent "
+                    f"of {len(history)} messages")
+        return relevant + history[window_start:]
+    
+    @staticmethod
+    def add_message(role: str, content: str, plots: Optional[List[bytes]] = None, image: Optional[bytes] = None) -> Dict:
         """
         Add a message to the chat history and persist to disk.
         
@@ -73,32 +164,75 @@ class ChatHistoryManager:
             content: The content of the message
             plots: Optional list of plot image data (as bytes)
             image: Optional user-uploaded image data (as bytes)
+            
+        Returns:
+            The stored message dictionary (including its timestamp)
         """
-        message = ChatMessage(role=role, content=content, plots=plots or [], image=image)
-        st.session_state[ChatHistoryManager.SESSION_KEY].append(message.to_dict())
+        # Same shape as ChatMessage.to_dict(), built directly since only the dict is stored
+        message = {
+            "role": role,
+            "content": content,
+            "timestamp": current_timestamp(),
+            "plots": plots or [],
+            "image": image
+        }
+        # Bind session state once; each st.session_state access goes through Streamlit's proxy
+        state = st.session_state
+        messages = state[ChatHistoryManager.SESSION_KEY]
+        gemini_messages = state[ChatHistoryManager.SESSION_KEY_GEMINI]
+        messages.append(message)
+        gemini_messages.append(ChatHistoryManager._to_gemini_format(message))
+        
+        # Cap the history, dropping the oldest messages
+        overflow = ChatHistoryManager._trim_history(messages)
+        if overflow:
+            del gemini_messages[:overflow]
+            # Keep the relevance window pointing at the same messages
+            window_start = state.get(ChatHistoryManager.WINDOW_START_KEY, 0)
+            state[ChatHistoryManager.WINDOW_START_KEY] = max(0, window_start - overflow)
+            logger.info(f"History limit reached - dropped {overflow} oldest message(s)")
+        
         plot_info = f" with {len(plots)} plot(s)" if plots else ""
         image_info = " with image" if image else ""
         logger.info(f"Added {role} message to history (length: {len(content)} chars{plot_info}{image_info})")
         
-        # Auto-save to file after each message
-        ChatHistoryManager._save_to_file()
+        # Auto-save to file after each message (coalesced with saves shortly after)
+        session_id = state.get(ChatHistoryManager.SESSION_ID_KEY)
+        ChatHistoryManager._save_to_file(session_id, message)
+        
+        # The file is an append-only log; rewrite it with just the kept messages once
+        # it holds as many dropped ones, so it stays under twice the cap
+        if overflow:
+            dropped = state.get(ChatHistoryManager.DROPPED_KEY, 0) + overflow
+            if dropped >= AppConfig.MAX_HISTORY_MESSAGES and session_id:
+                PersistenceService.save_session(session_id, messages)
+                dropped = 0
+            state[ChatHistoryManager.DROPPED_KEY] = dropped
+        
+        return message
     
     @staticmethod
     def clear() -> None:
         """Clear all messages from the chat history and create new session."""
-        message_count = len(st.session_state.get(ChatHistoryManager.SESSION_KEY, []))
+        state = st.session_state
+        message_count = len(state.get(ChatHistoryManager.SESSION_KEY, []))
         
         # Delete old session file
-        if ChatHistoryManager.SESSION_ID_KEY in st.session_state:
-            old_session_id = st.session_state[ChatHistoryManager.SESSION_ID_KEY]
+        old_session_id = state.get(ChatHistoryManager.SESSION_ID_KEY)
+        if old_session_id:
+            # Also drops its buffered messages, so a pending flush can't recreate the file
             PersistenceService.delete_session(old_session_id)
         
         # Clear messages
-        st.session_state[ChatHistoryManager.SESSION_KEY] = []
+        state[ChatHistoryManager.SESSION_KEY] = []
+        state[ChatHistoryManager.SESSION_KEY_GEMINI] = []
+        state.pop(ChatHistoryManager.WINDOW_START_KEY, None)
+        state.pop(ChatHistoryManager.DROPPED_KEY, None)
+        UploadCache.clear()
         
         # Generate new session ID
         new_session_id = PersistenceService.generate_session_id()
-        st.session_state[ChatHistoryManager.SESSION_ID_KEY] = new_session_id
+        state[ChatHistoryManager.SESSION_ID_KEY] = new_session_id
         
         logger.info(f"Cleared chat history ({message_count} messages removed) - New session: {new_session_id}")
     
@@ -127,14 +261,32 @@ class ChatHistoryManager:
         return messages[-n:] if n < len(messages) else messages
     
     @staticmethod
-    def _save_to_file() -> None:
-        """Save current chat history to file."""
-        try:
-            session_id = st.session_state.get(ChatHistoryManager.SESSION_ID_KEY)
-            messages = st.session_state.get(ChatHistoryManager.SESSION_KEY, [])
+    def _trim_history(messages: List[Dict]) -> int:
+        """
+        Drop the oldest messages beyond AppConfig.MAX_HISTORY_MESSAGES, in place.
+        
+        More are dropped if needed so the history still starts with a user message.
+        
+        Args:
+            messages: Chat messages, oldest first
             
-            if session_id and messages:
-                PersistenceService.save_session(session_id, messages)
+        Returns:
+            Number of messages dropped
+        """
+        overflow = len(messages) - AppConfig.MAX_HISTORY_MESSAGES
+        if overflow <= 0:
+            return 0
+        while overflow < len(messages) - 1 and messages[overflow]["role"] != _USER_ROLE:
+            overflow += 1
+        del messages[:overflow]
+        return overflow
+    
+    @staticmethod
+    def _save_to_file(session_id: Optional[str], message: Dict) -> None:
+        """Append a new message to the session file (buffered, written in the background)."""
+        try:
+            if session_id:
+                PersistenceService.append_message(session_id, message)
         except Exception as e:
             logger.error(f"Error saving chat history: {str(e)}", exc_info=True)
     
@@ -143,5 +295,19 @@ class ChatHistoryManager:
         """Create a new empty session."""
         session_id = PersistenceService.generate_session_id()
         st.session_state[ChatHistoryManager.SESSION_KEY] = []
+        st.session_state[ChatHistoryManager.SESSION_KEY_GEMINI] = []
         st.session_state[ChatHistoryManager.SESSION_ID_KEY] = session_id
         logger.info(f"New session created: {session_id}")
+    
+    @staticmethod
+    def _to_gemini_format(message: Dict) -> Dict:
+        """
+        Convert a single chat message to Gemini API format.
+        
+        Args:
+            message: Message dictionary with 'role' and 'content' keys
+            
+        Returns:
+            Message in Gemini format
+        """
+        return {"role": _ROLE_MAP.get(message["role"], _MODEL_ROLE), "parts": [message["content"]]}
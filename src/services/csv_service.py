@@ -2,12 +2,26 @@
 CSV service for loading, processing, and uploading CSV files for AI analysis.
 """
 
+import hashlib
+import io
+import time
 import pandas as pd
 import streamlit as st
-import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Union, Optional
+from config import MODEL_NAME, get_genai_client
+from ..models.constants import AppConfig
 from logger_config import get_logger
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    pa = None
+    pa_csv = None
+
 logger = get_logger(__name__)
 
 
@@ -19,8 +33,27 @@ class CSVService:
     - CSV loading from file uploads or URLs
     - DataFrame information extraction
     - File upload to Gemini API for direct analysis
+    - Context caching of the uploaded file for follow-up questions
     """
     
+    # Lifetime of the Gemini context cache holding the uploaded CSV
+    CONTEXT_CACHE_TTL_SECONDS = 600
+    
+    # In-memory size below which a CSV plus prompt cannot get near the token
+    # limit (CSV text is at most a few times larger than the in-memory data)
+    SMALL_CSV_BYTES = 200_000
+    
+    # Rows serialized to extrapolate the CSV size of larger DataFrames
+    TOKEN_ESTIMATE_SAMPLE_ROWS = 2000
+    
+    # Polling of the uploaded file's processing state (seconds, doubled after each check)
+    UPLOAD_POLL_INITIAL_DELAY = 0.1
+    UPLOAD_POLL_MAX_DELAY = 2.0
+    
+    # Background workers for Gemini uploads, shared by all sessions
+    _upload_executor = ThreadPoolExecutor(max_workers=AppConfig.UPLOAD_MAX_WORKERS,
+                                          thread_name_prefix="gemini-upload")
+    
     @staticmethod
     def load_csv(file_or_url: Union[st.runtime.uploaded_file_manager.UploadedFile, str, None]) -> Optional[pd.DataFrame]:
         """
@@ -44,10 +77,10 @@ class CSVService:
                 if not file_or_url.strip():
                     st.error("❌ Please provide a valid URL")
                     return None
-                df = pd.read_csv(file_or_url)
+                df = CSVService._read_csv(file_or_url)
                 logger.info(f"CSV loaded from URL: {df.shape[0]} rows × {df.shape[1]} cols")
             else:
-                df = pd.read_csv(file_or_url)
+                df = CSVService._read_csv(file_or_url)
                 logger.info(f"CSV loaded from file: {df.shape[0]} rows × {df.shape[1]} cols")
             
             # Validate
@@ -62,13 +95,101 @@ class CSVService:
             st.error(f"❌ **Error Loading CSV**\n\n{str(e)}")
             return None
     
+    @staticmethod
+    def _read_csv(source) -> pd.DataFrame:
+        """
+        Parse a CSV with pyarrow's multithreaded reader into Arrow-backed columns.
+        
+        Falls back to the default pandas parser if pyarrow is not installed or
+        rejects the file (it is stricter about malformed rows).
+        
+        Args:
+            source: URL string or file-like object
+            
+        Returns:
+            Loaded DataFrame
+        """
+        if PYARROW_AVAILABLE:
+            try:
+                return pd.read_csv(source, engine='pyarrow', dtype_backend='pyarrow')
+            except (pa.ArrowException, ValueError) as e:
+                logger.warning(f"pyarrow CSV parser failed, using pandas: {str(e)}")
+                if hasattr(source, 'seek'):
+                    source.seek(0)
+        return pd.read_csv(source)
+    
+    @staticmethod
+    def compute_fingerprint(df: pd.DataFrame) -> str:
+        """
+        Compute a content hash identifying a DataFrame.
+        
+        Two DataFrames with the same values, index and column names produce
+        the same fingerprint, so it can be used as a cache key for work that
+        only depends on the data (e.g. the Gemini file upload).
+        
+        Args:
+            df: Pandas DataFrame to fingerprint
+            
+        Returns:
+            Hex digest string
+        """
+        row_hashes = pd.util.hash_pandas_object(df, index=True).values.tobytes()
+        columns = repr(list(df.columns)).encode('utf-8')
+        return hashlib.blake2b(row_hashes + columns).hexdigest()
+    
+    @staticmethod
+    def get_session_fingerprint(df: pd.DataFrame) -> str:
+        """
+        Get the fingerprint of the session's loaded DataFrame.
+        
+        The fingerprint is stored in session state when the CSV is loaded, so
+        the DataFrame is hashed once per load rather than on every turn.
+        
+        Args:
+            df: The DataFrame stored in st.session_state['df']
+            
+        Returns:
+            Hex digest string
+        """
+        fingerprint = st.session_state.get('df_fp')
+        if fingerprint is None:
+            fingerprint = CSVService.compute_fingerprint(df)
+            st.session_state['df_fp'] = fingerprint
+        return fingerprint
+    
+    @staticmethod
+    def to_csv_bytes(df: pd.DataFrame) -> bytes:
+        """
+        Serialize a DataFrame to the CSV bytes that are uploaded to Gemini.
+        
+        Uses pyarrow's native CSV writer when it is installed (several times
+        faster on large frames) and falls back to pandas for data pyarrow
+        cannot convert, such as object columns with mixed types.
+        
+        Args:
+            df: Pandas DataFrame to serialize
+            
+        Returns:
+            UTF-8 CSV data with '\\n' line endings and no index column
+        """
+        if PYARROW_AVAILABLE:
+            try:
+                sink = pa.BufferOutputStream()
+                pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), sink)
+                return sink.getvalue().to_pybytes()
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                logger.debug(f"pyarrow CSV writer failed, using pandas: {str(e)}")
+        return df.to_csv(index=False, lineterminator='\n').encode('utf-8')
+    
     @staticmethod
     def estimate_csv_tokens(df: pd.DataFrame) -> int:
         """
         Estimate the number of tokens in a CSV DataFrame.
         
         Uses a conservative estimate where 1 token ≈ 4 characters.
-        This includes all data, column names, and CSV formatting.
+        This includes all data, column names, and CSV formatting. The CSV
+        size is extrapolated from evenly spaced sample rows instead of
+        serializing the whole DataFrame.
         
         Args:
             df: Pandas DataFrame to estimate
@@ -77,13 +198,14 @@ class CSVService:
             Estimated number of tokens
         """
         try:
-            # Convert DataFrame to CSV string (in-memory)
-            import io
-            csv_buffer = io.StringIO()
-            df.to_csv(csv_buffer, index=False)
-            csv_string = csv_buffer.getvalue()
-            # Calculate total characters and estimate tokens (1 token ≈ 4 chars)
-            estimated_tokens = len(csv_string) // 4
+            step = max(1, -(-len(df) // CSVService.TOKEN_ESTIMATE_SAMPLE_ROWS))
+            sample = df.iloc[::step]
+            sample_csv = CSVService.to_csv_bytes(sample)
+            header_size = sample_csv.find(b'\n') + 1
+            rows_size = len(sample_csv) - header_size
+            csv_size = header_size + int(rows_size * len(df) / max(len(sample), 1))
+            # Calculate total size and estimate tokens (1 token ≈ 4 chars)
+            estimated_tokens = csv_size // 4
             logger.info(f"Estimated tokens: ~{estimated_tokens:,}")
             return estimated_tokens
             
@@ -92,9 +214,46 @@ class CSVService:
             return 1_000_000  # Safe fallback
     
     @staticmethod
-    def validate_token_limit(df: pd.DataFrame, prompt_text: str = "", max_tokens: int = 1_000_000) -> dict:
-        """Validate CSV and prompt won't exceed token limits."""
-        csv_tokens = CSVService.estimate_csv_tokens(df)
+    def get_token_estimate(df: pd.DataFrame, fingerprint: str) -> int:
+        """
+        Estimate CSV tokens, reusing the session-cached value while the data is unchanged.
+        
+        Args:
+            df: Pandas DataFrame to estimate
+            fingerprint: Fingerprint of df from compute_fingerprint()
+            
+        Returns:
+            Estimated number of tokens
+        """
+        if st.session_state.get('csv_tokens_hash') != fingerprint:
+            st.session_state['csv_tokens'] = CSVService.estimate_csv_tokens(df)
+            st.session_state['csv_tokens_hash'] = fingerprint
+        return st.session_state['csv_tokens']
+    
+    @staticmethod
+    def is_small_csv(df: pd.DataFrame, fingerprint: str, prompt_text: str = "") -> bool:
+        """
+        Check whether a CSV is small enough to skip token validation.
+        
+        Args:
+            df: Pandas DataFrame to check
+            fingerprint: Fingerprint of df from compute_fingerprint()
+            prompt_text: Prompt that will be sent with the CSV
+            
+        Returns:
+            True if df and prompt are well under the token limit
+        """
+        if st.session_state.get('df_bytes_hash') != fingerprint:
+            st.session_state['df_bytes'] = int(df.memory_usage(deep=True).sum())
+            st.session_state['df_bytes_hash'] = fingerprint
+        return st.session_state['df_bytes'] + len(prompt_text) < CSVService.SMALL_CSV_BYTES
+    
+    @staticmethod
+    def validate_token_limit(df: pd.DataFrame, prompt_text: str = "", max_tokens: int = 1_000_000,
+                             csv_tokens: Optional[int] = None) -> dict:
+        """Validate CSV and prompt won't exceed token limits (pass csv_tokens to reuse a prior estimate)."""
+        if csv_tokens is None:
+            csv_tokens = CSVService.estimate_csv_tokens(df)
         prompt_tokens = len(prompt_text) // 4
         total_tokens = csv_tokens + prompt_tokens
         is_valid = total_tokens <= max_tokens
@@ -114,67 +273,131 @@ class CSVService:
             'message': message
         }
     
+    @staticmethod
+    def upload_csv_to_gemini_async(df: pd.DataFrame) -> Future:
+        """
+        Start rendering and uploading a CSV in a background thread.
+        
+        The worker is released as soon as the file is uploaded; pass the
+        result to wait_for_processing() to wait until Gemini can use it.
+        
+        Args:
+            df: Pandas DataFrame to upload
+            
+        Returns:
+            Future resolving to the uploaded (possibly still processing) file reference, or None on failure
+        """
+        return CSVService._upload_executor.submit(CSVService._upload_csv_file, df)
+    
     @staticmethod
     def upload_csv_to_gemini(df: pd.DataFrame):
-        """Upload CSV to Gemini API for file-based analysis (supports up to 2GB)."""
+        """Upload CSV to Gemini API for file-based analysis (supports up to 2GB). Safe to call off the script thread."""
+        return CSVService.wait_for_processing(CSVService._upload_csv_file(df))
+    
+    @staticmethod
+    def _upload_csv_file(df: pd.DataFrame):
+        """Render a CSV and upload it to Gemini without waiting for processing; None on failure."""
         try:
-            from google import genai
-            import os
-            from dotenv import load_dotenv
-            import time
-            
-            load_dotenv()
-            
-            upload_start = time.time()
+            upload_start = time.perf_counter()
             logger.info(f"[UPLOAD] Starting CSV upload: {df.shape[0]} rows × {df.shape[1]} cols")
             
-            # Create temp CSV file
-            csv_start = time.time()
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, newline='') as tmp_file:
-                csv_path = tmp_file.name
-                df.to_csv(tmp_file, index=False)
-            csv_time = time.time() - csv_start
+            # Render the CSV in memory
+            csv_start = time.perf_counter()
+            csv_bytes = CSVService.to_csv_bytes(df)
+            csv_time = time.perf_counter() - csv_start
             
-            size_mb = os.path.getsize(csv_path) / (1024 * 1024)
-            logger.info(f"[UPLOAD] CSV file created in {csv_time:.2f}s ({size_mb:.2f} MB)")
+            size_mb = len(csv_bytes) / (1024 * 1024)
+            logger.info(f"[UPLOAD] CSV rendered in {csv_time:.2f}s ({size_mb:.2f} MB)")
             
-            # Upload to Gemini
-            api_start = time.time()
-            client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-            uploaded_file = client.files.upload(file=csv_path, config={'mime_type': 'text/csv'})
-            api_time = time.time() - api_start
-            logger.info(f"[UPLOAD] API upload completed in {api_time:.2f}s")
+            # Upload to Gemini straight from memory (no temp file)
+            api_start = time.perf_counter()
+            client = get_genai_client()
+            uploaded_file = client.files.upload(file=io.BytesIO(csv_bytes), config={'mime_type': 'text/csv'})
+            api_time = time.perf_counter() - api_start
+            logger.info(f"[UPLOAD] API upload completed in {api_time:.2f}s "
+                        f"(total {time.perf_counter() - upload_start:.2f}s, file: {uploaded_file.name})")
+            return uploaded_file
             
-            os.unlink(csv_path)  # Clean up immediately
+        except Exception as e:
+            logger.error(f"[UPLOAD] Error: {str(e)}", exc_info=True)
+            return None
+    
+    @staticmethod
+    def wait_for_processing(uploaded_file):
+        """
+        Wait until Gemini has processed an uploaded file.
+        
+        Polls the file state with exponential backoff for at most 60s - most
+        files are ready in well under a second.
+        
+        Args:
+            uploaded_file: File reference from the upload, or None if it failed
             
-            # Wait for processing (max 60s)
-            process_start = time.time()
+        Returns:
+            The processed file reference, or None if the upload or processing failed
+        """
+        if uploaded_file is None:
+            return None
+        
+        try:
+            process_start = time.perf_counter()
             check_count = 0
+            poll_delay = CSVService.UPLOAD_POLL_INITIAL_DELAY
+            client = get_genai_client()
             while uploaded_file.state.name == "PROCESSING":
-                if time.time() - process_start > 60:
+                if time.perf_counter() - process_start > 60:
                     logger.error(f"[UPLOAD] Timeout after 60s ({check_count} checks)")
-                    st.error("❌ Upload timeout - please try a smaller file")
                     return None
-                time.sleep(0.5)
+                time.sleep(poll_delay)
+                poll_delay = min(poll_delay * 2, CSVService.UPLOAD_POLL_MAX_DELAY)
                 check_count += 1
                 uploaded_file = client.files.get(name=uploaded_file.name)
-            process_time = time.time() - process_start
+            process_time = time.perf_counter() - process_start
             logger.info(f"[UPLOAD] File processing completed in {process_time:.2f}s ({check_count} checks)")
             
             if uploaded_file.state.name == "FAILED":
                 logger.error(f"[UPLOAD] Upload failed with state: {uploaded_file.state.name}")
-                st.error("❌ Upload failed - please try reloading the CSV")
                 return None
             
-            total_time = time.time() - upload_start
-            logger.info(f"[UPLOAD] ✅ Total upload time: {total_time:.2f}s (file: {uploaded_file.name})")
+            logger.info(f"[UPLOAD] ✅ File ready: {uploaded_file.name}")
             return uploaded_file
             
         except Exception as e:
             logger.error(f"[UPLOAD] Error: {str(e)}", exc_info=True)
-            try:
-                if 'csv_path' in locals():
-                    os.unlink(csv_path)
-            except Exception:
-                pass
+            return None
+    
+    @staticmethod
+    def create_context_cache(uploaded_file, instructions: str) -> Optional[str]:
+        """
+        Cache an uploaded CSV file and static instructions in Gemini.
+        
+        Subsequent requests reference the cache by name and only send the
+        user's question. Gemini rejects caches below its minimum token count,
+        in which case the caller should fall back to sending the full prompt.
+        
+        Args:
+            uploaded_file: File reference returned by upload_csv_to_gemini
+            instructions: Prompt text to cache together with the file
+            
+        Returns:
+            Cache resource name, or None if the cache could not be created
+        """
+        try:
+            from google.genai import types
+            
+            cache_start = time.perf_counter()
+            client = get_genai_client()
+            cache = client.caches.create(
+                model=MODEL_NAME,
+                config=types.CreateCachedContentConfig(
+                    contents=[uploaded_file, instructions],
+                    ttl=f"{CSVService.CONTEXT_CACHE_TTL_SECONDS}s"
+                )
+            )
+            cache_time = time.perf_counter() - cache_start
+            logger.info(f"[CACHE] Context cache created in {cache_time:.2f}s (cache: {cache.name})")
+            return cache.name
+            
+        except Exception as e:
+            logger.warning(f"[CACHE] Context cache not created, sending full prompt instead: {str(e)}")
             return None
@@ -0,0 +1,61 @@
+"""
+Text embedding service.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+import google.generativeai as genai
+from config import EMBEDDING_MODEL
+
+
+class EmbeddingService:
+    """Embeds text with Gemini's embedding model."""
+    
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_TTL_SECONDS = 3600
+    
+    # text -> (time embedded, embedding); shared by all sessions in the process
+    _cache: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+    _cache_lock = threading.Lock()
+    
+    @staticmethod
+    def embed_texts(texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts with Gemini, reusing embeddings computed for identical text before.
+        
+        Texts not in the cache are embedded together in a single request.
+        
+        Args:
+            texts: Texts to embed
+        
+        Returns:
+            One embedding vector per text, in order
+        
+        Raises:
+            Exception: If the embedding request fails
+        """
+        found = {}
+        now = time.monotonic()
+        with EmbeddingService._cache_lock:
+            for text in texts:
+                entry = EmbeddingService._cache.get(text)
+                if entry is None or now - entry[0] > EmbeddingService.CACHE_TTL_SECONDS:
+                    continue
+                EmbeddingService._cache.move_to_end(text)
+                found[text] = entry[1]
+        
+        misses = list(dict.fromkeys(text for text in texts if text not in found))
+        if misses:
+            vectors = genai.embed_content(model=EMBEDDING_MODEL, content=misses)["embedding"]
+            now = time.monotonic()
+            with EmbeddingService._cache_lock:
+                for text, vector in zip(misses, vectors):
+                    found[text] = vector
+                    EmbeddingService._cache[text] = (now, vector)
+                    EmbeddingService._cache.move_to_end(text)
+                while len(EmbeddingService._cache) > EmbeddingService.CACHE_MAX_ENTRIES:
+                    EmbeddingService._cache.popitem(last=False)
+        
+        return [found[text] for text in texts]
@@ -2,12 +2,20 @@
 Gemini AI chat service.
 """
 
-from typing import List, Dict, Generator, Union
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Generator, Optional, Union
+import msgpack
 from PIL import Image
-from config import model, MODEL_NAME, GENERATION_CONFIG_WITH_CODE_EXECUTION
-from ..models.constants import MessageRole
-from ..models.message import GeminiMessage
+from config import get_model, get_genai_client, MODEL_NAME, GENERATION_CONFIG_WITH_CODE_EXECUTION
+from ..models.constants import AppConfig
 from .plot_service import PlotService
+from .response_cache import SemanticResponseCache
 from logger_config import get_logger
 
 # Import new genai client for file upload support
@@ -24,104 +32,324 @@ logger = get_logger(__name__)
 class GeminiChatService:
     """Handles communication with the Gemini AI model."""
     
-    def __init__(self):
-        """Initialize the chat service with the Gemini model."""
-        self.model = model
-        logger.info("GeminiChatService initialized")
+    # Opt-in chat answer cache, shared by all instances: digest of (session, prompt, history)
+    # -> (answer, stored_at), least recently used first. Loaded from disk on first use and
+    # saved by the exit hook at the bottom of this module.
+    _chat_cache: Optional[OrderedDict] = None
+    _chat_cache_lock = threading.Lock()
     
-    def _convert_to_gemini_format(
-        self, 
-        messages: List[Dict[str, str]]
-    ) -> List[Dict]:
+    def __init__(self, response_cache: Optional[SemanticResponseCache] = None):
         """
-        Convert chat history to Gemini API format.
+        Initialize the chat service with the Gemini model.
         
         Args:
-            messages: List of message dictionaries
-            
-        Returns:
-            List of messages in Gemini format
-        """
-        gemini_messages = []
-        for msg in messages:
-            role = MessageRole.USER.value if msg["role"] == MessageRole.USER.value else MessageRole.MODEL.value
-            gemini_msg = GeminiMessage(role=role, parts=[msg["content"]])
-            gemini_messages.append(gemini_msg.to_dict())
-        return gemini_messages
+            response_cache: Cache for answers about uploaded files (a new one by default)
+        """
+        self.model = get_model()
+        self.response_cache = response_cache or SemanticResponseCache()
+        logger.info("GeminiChatService initialized")
     
     def get_response_stream(
         self, 
         prompt: str, 
-        history: List[Dict[str, str]],
+        history: List[Dict],
         image: Union[Image.Image, None] = None,
-        uploaded_file_ref = None
+        uploaded_file_ref = None,
+        cached_content: Optional[str] = None,
+        question: Optional[str] = None,
+        session_id: Optional[str] = None
     ) -> Generator[str, None, None]:
-        """Get streaming response from model."""
-        import time
+        """Get streaming response from model (history: Gemini-format, ending with the current prompt; cached_content: Gemini context cache holding the file; question: the user's own words, enables the response cache for file questions; session_id: chat session, scopes the chat answer cache)."""
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # File upload API for CSV
             if uploaded_file_ref and GENAI_CLIENT_AVAILABLE:
+                # File answers don't depend on chat history, so a repeated question about this file reuses its answer
+                cache_namespace = (MODEL_NAME, uploaded_file_ref.name, "stream")
+                cached = self.response_cache.lookup(cache_namespace, question) if question else None
+                if cached is not None:
+                    yield cached
+                    return
+                
                 logger.info(f"[RESPONSE] Using file upload API for: {uploaded_file_ref.name}")
                 logger.info(f"[RESPONSE] Prompt length: {len(prompt)} chars")
                 
-                api_start = time.time()
-                client = genai.Client()
-                response = client.models.generate_content_stream(
-                    model=MODEL_NAME,
-                    contents=[uploaded_file_ref, prompt]
-                )
-                api_call_time = time.time() - api_start
+                api_start = time.perf_counter()
+                client = get_genai_client()
+                if cached_content:
+                    logger.info(f"[RESPONSE] Using context cache: {cached_content}")
+                    response = client.models.generate_content_stream(
+                        model=MODEL_NAME,
+                        contents=[prompt],
+                        config={'cached_content': cached_content}
+                    )
+                else:
+                    response = client.models.generate_content_stream(
+                        model=MODEL_NAME,
+                        contents=[uploaded_file_ref, prompt]
+                    )
+                api_call_time = time.perf_counter() - api_start
                 logger.info(f"[RESPONSE] API call initiated in {api_call_time:.2f}s")
                 
-                chunk_count = 0
-                first_chunk_time = None
-                for chunk in response:
-                    if chunk.text:
-                        if chunk_count == 0:
-                            first_chunk_time = time.time() - start_time
-                            logger.info(f"[RESPONSE] First chunk received in {first_chunk_time:.2f}s")
-                        chunk_count += 1
-                        yield chunk.text
-                
-                total_time = time.time() - start_time
-                logger.info(f"[RESPONSE] ✅ Complete: {chunk_count} chunks in {total_time:.2f}s")
+                pieces = []
+                for piece in self._stream_text(response, start_time):
+                    pieces.append(piece)
+                    yield piece
+                if question and pieces:
+                    self.response_cache.store(cache_namespace, question, "".join(pieces))
                 return
             
-            # Regular chat with history
+            # Regular chat with history (with the opt-in chat cache, a repeated text-only
+            # follow-up in the same session is answered from cache; first turns never are)
+            chat_key = None
+            if AppConfig.CHAT_CACHE_ENABLED and session_id and not image and len(history) > 1:
+                chat_key = self._chat_cache_key(session_id, prompt, history[:-1])
+            if chat_key is not None:
+                cached = self._get_cached_chat_answer(chat_key)
+                if cached is not None:
+                    logger.info(f"[CACHE] Chat response cache hit: '{prompt[:60]}'")
+                    yield cached
+                    return
+            
             logger.info(f"[RESPONSE] Using regular chat API, history: {len(history)} messages")
-            gemini_history = self._convert_to_gemini_format(history[:-1])
-            chat = self.model.start_chat(history=gemini_history if gemini_history else [])
+            chat = self.model.start_chat(history=history[:-1])
             message_content = [prompt, image] if image else prompt
             response = chat.send_message(message_content, stream=True)
             
-            chunk_count = 0
-            for chunk in response:
-                if chunk.text:
-                    chunk_count += 1
-                    yield chunk.text
-            
-            total_time = time.time() - start_time
-            logger.info(f"[RESPONSE] ✅ Complete: {chunk_count} chunks in {total_time:.2f}s")
+            pieces = []
+            for piece in self._stream_text(response, start_time):
+                pieces.append(piece)
+                yield piece
+            if chat_key is not None and pieces:
+                self._cache_chat_answer(chat_key, "".join(pieces))
             
         except Exception as e:
-            logger.error(f"[RESPONSE] Error after {time.time() - start_time:.2f}s: {str(e)}", exc_info=True)
+            logger.error(f"[RESPONSE] Error after {time.perf_counter() - start_time:.2f}s: {str(e)}", exc_info=True)
             if "token" in str(e).lower():
                 raise ValueError("❌ Token limit exceeded - try clearing chat history or using a smaller CSV")
             raise
     
+    @staticmethod
+    def _chat_cache_key(session_id: str, prompt: str, history: List[Dict]) -> bytes:
+        """
+        Digest identifying a chat turn by its session, prompt and the history sent before it.
+        
+        Args:
+            session_id: Chat session the turn belongs to (answers are never shared between sessions)
+            prompt: The prompt sent to Gemini
+            history: Gemini-format messages preceding the prompt
+            
+        Returns:
+            A 16-byte BLAKE2b digest
+        """
+        digest = hashlib.blake2b(MODEL_NAME.encode(), digest_size=16)
+        digest.update(b"\x03" + session_id.encode())
+        for message in history:
+            digest.update(b"\x00" + message["role"].encode())
+            for part in message["parts"]:
+                digest.update(b"\x01" + str(part).encode())
+        digest.update(b"\x02" + prompt.encode())
+        return digest.digest()
+    
+    @staticmethod
+    def _chat_entries() -> OrderedDict:
+        """The chat answer cache, loaded from disk on first use (call with _chat_cache_lock held)."""
+        if GeminiChatService._chat_cache is None:
+            GeminiChatService._chat_cache = GeminiChatService._load_chat_cache()
+        return GeminiChatService._chat_cache
+    
+    @staticmethod
+    def _get_cached_chat_answer(key: bytes) -> Optional[str]:
+        """Return the cached answer for a chat turn, or None if missing or expired."""
+        with GeminiChatService._chat_cache_lock:
+            entries = GeminiChatService._chat_entries()
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            answer, stored_at = entry
+            if time.time() - stored_at > AppConfig.CHAT_CACHE_TTL_SECONDS:
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return answer
+    
+    @staticmethod
+    def _cache_chat_answer(key: bytes, answer: str) -> None:
+        """Cache the answer to a chat turn, dropping the least recently used beyond the limit."""
+        with GeminiChatService._chat_cache_lock:
+            entries = GeminiChatService._chat_entries()
+            entries[key] = (answer, time.time())
+            entries.move_to_end(key)
+            while len(entries) > AppConfig.CHAT_CACHE_MAX_ENTRIES:
+                entries.popitem(last=False)
+    
+    @staticmethod
+    def _load_chat_cache() -> OrderedDict:
+        """
+        Load the chat answers saved by a previous run.
+        
+        Returns:
+            The unexpired entries in least recently used order (empty if there is no readable file)
+        """
+        cache = OrderedDict()
+        try:
+            with open(AppConfig.CHAT_CACHE_FILE, "rb") as f:
+                records = msgpack.unpackb(f.read())
+        except FileNotFoundError:
+            return cache
+        except Exception as e:
+            logger.warning(f"[CACHE] Ignoring unreadable chat response cache: {str(e)}")
+            return cache
+        
+        cutoff = time.time() - AppConfig.CHAT_CACHE_TTL_SECONDS
+        for key, answer, stored_at in records[-AppConfig.CHAT_CACHE_MAX_ENTRIES:]:
+            if stored_at >= cutoff:
+                cache[key] = (answer, stored_at)
+        logger.info(f"[CACHE] Loaded {len(cache)} cached chat responses")
+        return cache
+    
+    @staticmethod
+    def _save_chat_cache() -> None:
+        """
+        Write the chat answers to disk (called once, at exit), replacing the previous file atomically.
+        
+        Nothing is written unless the cache was used. Keys are digests that
+        include the session id, so entries only ever match their own session.
+        """
+        with GeminiChatService._chat_cache_lock:
+            entries = GeminiChatService._chat_cache
+            if not entries:
+                return
+            records = [[key, answer, stored_at] for key, (answer, stored_at) in entries.items()]
+        try:
+            os.makedirs(os.path.dirname(AppConfig.CHAT_CACHE_FILE), exist_ok=True)
+            temp_path = AppConfig.CHAT_CACHE_FILE + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(msgpack.packb(records))
+            os.replace(temp_path, AppConfig.CHAT_CACHE_FILE)
+        except Exception as e:
+            logger.warning(f"[CACHE] Could not save chat response cache: {str(e)}")
+    
+    def _stream_text(self, response, start_time: float) -> Generator[str, None, None]:
+        """
+        Yield the text of a streamed Gemini response, logging only its timing.
+        
+        Each chunk's text is read once (the SDK assembles it from the chunk's
+        parts on every access), and the only logging is the time to the first
+        chunk and a summary at the end. Batching for the UI happens in
+        ChatUI.display_streaming_response, which redraws at most once per
+        AppConfig.STREAM_RENDER_INTERVAL. Chunks are received by
+        _prefetch_text while the previous one is being displayed.
+        
+        Args:
+            response: Streaming response from either Gemini SDK
+            start_time: time.perf_counter() when the request started
+            
+        Yields:
+            Response text, split by _smooth_chunks
+        """
+        chunk_count = 0
+        for text in self._prefetch_text(response):
+            if not text:
+                continue
+            if not chunk_count:
+                logger.info(f"[RESPONSE] First chunk received in {time.perf_counter() - start_time:.2f}s")
+            chunk_count += 1
+            yield from self._smooth_chunks(text)
+        
+        total_time = time.perf_counter() - start_time
+        logger.info(f"[RESPONSE] ✅ Complete: {chunk_count} chunks in {total_time:.2f}s")
+    
+    @staticmethod
+    def _prefetch_text(response, maxsize: int = AppConfig.STREAM_PREFETCH_CHUNKS) -> Generator[str, None, None]:
+        """
+        Read a streamed response's chunk texts in a background thread.
+        
+        The network read and parsing of chunk N+1 overlap with the UI
+        rendering (and smoothing) of chunk N. At most maxsize chunks are read
+        ahead; errors from the stream are re-raised in the caller.
+        
+        Args:
+            response: Streaming response from either Gemini SDK
+            maxsize: Chunks read ahead of the consumer
+            
+        Yields:
+            The text of each chunk, in order
+        """
+        chunks = queue.Queue(maxsize=maxsize)
+        stop = threading.Event()
+        done = object()
+        
+        def _put(item) -> bool:
+            # Give up once the consumer has gone away, instead of blocking forever
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def _produce():
+            try:
+                for chunk in response:
+                    if not _put(chunk.text):
+                        return
+                _put(done)
+            except Exception as e:
+                _put(e)
+        
+        threading.Thread(target=_produce, name="gemini-stream-prefetch", daemon=True).start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+    
+    @staticmethod
+    def _smooth_chunks(text: str) -> Generator[str, None, None]:
+        """
+        Split a large streamed chunk into small, evenly paced pieces.
+        
+        Gemini sometimes returns hundreds of characters in one chunk, which
+        makes the streamed reply jump. Short chunks are passed through as-is.
+        
+        Args:
+            text: Text of one streamed chunk
+            
+        Yields:
+            Pieces of the chunk, in order
+        """
+        if len(text) <= AppConfig.SMOOTH_STREAM_THRESHOLD:
+            yield text
+            return
+        
+        step = AppConfig.MICRO_CHUNK
+        piece_count = -(-len(text) // step)
+        # Keep very large chunks from holding the reply back for long
+        delay = min(AppConfig.MICRO_CHUNK_DELAY, AppConfig.SMOOTH_STREAM_MAX_DELAY / piece_count)
+        for i in range(0, len(text), step):
+            if i:
+                time.sleep(delay)
+            yield text[i:i + step]
+    
     def get_response(
         self, 
         prompt: str, 
-        history: List[Dict[str, str]] = None
+        history: List[Dict] = None
     ) -> str:
         """
         Get a non-streaming response from the model.
         
         Args:
             prompt: The user's input prompt
-            history: Optional previous conversation history
+            history: Optional previous conversation history in Gemini format
             
         Returns:
             The model's response as a string
@@ -130,8 +358,7 @@ class GeminiChatService:
             Exception: If there's an error communicating with the model
         """
         if history:
-            gemini_history = self._convert_to_gemini_format(history)
-            chat = self.model.start_chat(history=gemini_history)
+            chat = self.model.start_chat(history=history)
             response = chat.send_message(prompt)
         else:
             response = self.model.generate_content(prompt)
@@ -141,9 +368,10 @@ class GeminiChatService:
     def get_response_with_plots(
         self,
         prompt: str,
-        history: List[Dict[str, str]],
+        history: List[Dict],
         image: Union[Image.Image, None] = None,
-        uploaded_file_ref = None
+        uploaded_file_ref = None,
+        question: Optional[str] = None
     ) -> Dict[str, any]:
         """
         Get response from model and extract any generated plots.
@@ -153,25 +381,29 @@ class GeminiChatService:
         
         Args:
             prompt: The user's input prompt
-            history: Previous conversation history
+            history: Conversation history in Gemini format, ending with the current prompt
             image: Optional image to include
             uploaded_file_ref: Optional uploaded file reference
+            question: The user's own words; enables the response cache for file questions
             
         Returns:
             Dictionary containing:
                 - 'text': Response text
                 - 'plots': List of PlotData objects
         """
-        import time
-        
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             plots = []
             
             # File upload API for CSV
             if uploaded_file_ref and GENAI_CLIENT_AVAILABLE:
+                cache_namespace = (MODEL_NAME, uploaded_file_ref.name, "plots")
+                cached = self.response_cache.lookup(cache_namespace, question) if question else None
+                if cached is not None:
+                    return cached
+                
                 logger.info("[RESPONSE] Using file upload API with plot detection")
-                client = genai.Client()
+                client = get_genai_client()
                 
                 # Use generation config with code execution enabled
                 response = client.models.generate_content(
@@ -186,11 +418,13 @@ class GeminiChatService:
                 # Extract text from response (handle mixed content with images)
                 response_text = self._extract_text_from_response(response)
                 
+                if question and (response_text or plots):
+                    self.response_cache.store(cache_namespace, question, {'text': response_text, 'plots': plots})
+                
             # Regular chat with history
             else:
                 logger.info("[RESPONSE] Using regular chat API with plot detection")
-                gemini_history = self._convert_to_gemini_format(history[:-1])
-                chat = self.model.start_chat(history=gemini_history if gemini_history else [])
+                chat = self.model.start_chat(history=history[:-1])
                 message_content = [prompt, image] if image else prompt
                 response = chat.send_message(message_content)
                 
@@ -200,7 +434,7 @@ class GeminiChatService:
                 # Extract text from response (handle mixed content with images)
                 response_text = self._extract_text_from_response(response)
             
-            elapsed = time.time() - start_time
+            elapsed = time.perf_counter() - start_time
             logger.info(f"[RESPONSE] Complete in {elapsed:.2f}s - text: {len(response_text)} chars, plots: {len(plots)}")
             
             return {
@@ -242,3 +476,7 @@ class GeminiChatService:
         except Exception as e:
             logger.warning(f"[WARNING] No text extracted from response: {str(e)}")
             return ""
+
+
+# Keep cached chat answers across restarts (a single hook, however many services are created)
+atexit.register(GeminiChatService._save_chat_cache)
@@ -1,26 +1,67 @@
 """
-Persistence service for saving and loading chat history to/from JSON files.
+Persistence service for saving and loading chat history to/from MessagePack files.
+
+Each session file is an append-only log of MessagePack records: a header
+({'session_id', 'created_at'}) followed by one record per message. Plot and
+image bytes are stored once per session in a content-addressed blob directory
+next to the log, and records reference them by hash.
 """
 
-import json
+import atexit
+import copy
+import hashlib
 import os
+import shutil
+import tempfile
+import threading
+from binascii import a2b_base64
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-import base64
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import msgpack
+from ..utils import json
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
 
 class PersistenceService:
-    """Handles saving and loading chat history from JSON files."""
+    """Handles saving and loading chat history from MessagePack files."""
     
     # Directory to store chat sessions
     SESSIONS_DIR = "chat_sessions"
     
+    # Session file suffix; files saved before the MessagePack switch use LEGACY_SUFFIX
+    SESSION_SUFFIX = ".msgpack"
+    LEGACY_SUFFIX = ".json"
+    
+    # Suffix of the per-session directory holding plot and image blobs
+    BLOBS_SUFFIX = ".blobs"
+    
     # Maximum age of sessions before auto-cleanup (in days)
     MAX_SESSION_AGE_DAYS = 7
     
+    # New messages are buffered and appended in one write once BUFFER_SIZE messages
+    # are pending, or FLUSH_INTERVAL seconds after the first one, whichever is sooner
+    BUFFER_SIZE = 16
+    FLUSH_INTERVAL = 1.0
+    
+    # Buffered saves: session_id -> messages waiting to be appended / pending flush timer.
+    # A batch is taken from _pending and written while holding _write_lock (always
+    # acquired before _pending_lock), so batches reach the log in the order they were taken.
+    _pending: Dict[str, List[Dict]] = {}
+    _timers: Dict[str, threading.Timer] = {}
+    _pending_lock = threading.Lock()
+    _write_lock = threading.Lock()
+    
+    # Sessions deleted by this process; a late flush must not recreate their files
+    _deleted: Set[str] = set()
+    
+    # Recently loaded sessions: session_id -> ((mtime_ns, size) of the file, decoded messages)
+    LOAD_CACHE_SIZE = 8
+    _load_cache: "OrderedDict[str, Tuple[Tuple[int, int], List[Dict]]]" = OrderedDict()
+    _load_cache_lock = threading.Lock()
+    
     @staticmethod
     def initialize() -> None:
         """Initialize the persistence service by creating necessary directories."""
@@ -43,7 +84,13 @@ class PersistenceService:
     @staticmethod
     def save_session(session_id: str, messages: List[Dict]) -> bool:
         """
-        Save chat session to JSON file.
+        Write a complete chat session file, replacing any existing one.
+        
+        Regular saves only append new messages (see append_message); this is
+        used to convert sessions saved in an older format. messages is the
+        complete session, so messages still buffered for it are dropped.
+        Plot and image bytes are written to the session's blob directory, and
+        blobs no longer referenced by any message are removed.
         
         Args:
             session_id: Unique identifier for the session
@@ -53,36 +100,24 @@ class PersistenceService:
             True if save was successful, False otherwise
         """
         try:
-            filepath = os.path.join(PersistenceService.SESSIONS_DIR, f"{session_id}.json")
-            
-            # Convert binary data to base64 for JSON serialization
-            serializable_messages = []
-            for msg in messages:
-                msg_copy = msg.copy()
-                
-                # Convert plots (list of bytes) to base64
-                if 'plots' in msg_copy and msg_copy['plots']:
-                    msg_copy['plots'] = [
-                        base64.b64encode(plot).decode('utf-8') 
-                        for plot in msg_copy['plots']
-                    ]
+            filepath = PersistenceService._session_path(session_id)
+            with PersistenceService._write_lock:
+                PersistenceService._take_pending(session_id)
+                if session_id in PersistenceService._deleted:
+                    return False
+                PersistenceService._forget_loaded(session_id)
                 
-                # Convert image (bytes) to base64
-                if 'image' in msg_copy and msg_copy['image']:
-                    msg_copy['image'] = base64.b64encode(msg_copy['image']).decode('utf-8')
+                # Written record by record, so no packed copy of the whole session is held in memory
+                blob_refs = set()
+                with open(filepath, 'wb') as f:
+                    f.writelines(PersistenceService._iter_records(session_id, messages, with_header=True,
+                                                                  blob_refs=blob_refs))
+                PersistenceService._prune_blobs(PersistenceService._blob_dir(session_id), blob_refs)
                 
-                serializable_messages.append(msg_copy)
-            
-            # Save to file with metadata
-            data = {
-                'session_id': session_id,
-                'created_at': datetime.now().isoformat(),
-                'message_count': len(messages),
-                'messages': serializable_messages
-            }
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+                # The MessagePack file supersedes a session saved in the old JSON format
+                legacy_path = PersistenceService._session_path(session_id, PersistenceService.LEGACY_SUFFIX)
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
             
             logger.info(f"Session saved: {session_id} ({len(messages)} messages)")
             return True
@@ -91,10 +126,82 @@ class PersistenceService:
             logger.error(f"Error saving session {session_id}: {str(e)}", exc_info=True)
             return False
     
+    @staticmethod
+    def append_message(session_id: str, message: Dict) -> None:
+        """
+        Buffer a message to be appended to the session file.
+        
+        The buffer is written off the script thread in a single write, at most
+        FLUSH_INTERVAL seconds after its first message (sooner once it holds
+        BUFFER_SIZE messages). Write cost per message is O(1).
+        
+        Args:
+            session_id: Unique identifier for the session
+            message: Message dictionary to append
+        """
+        with PersistenceService._pending_lock:
+            if session_id in PersistenceService._deleted:
+                return
+            pending = PersistenceService._pending.setdefault(session_id, [])
+            pending.append(message)
+            
+            timer = PersistenceService._timers.get(session_id)
+            if timer is not None and len(pending) < PersistenceService.BUFFER_SIZE:
+                return  # A flush is already scheduled for this buffer
+            if timer is not None:
+                timer.cancel()
+            
+            delay = PersistenceService.FLUSH_INTERVAL if len(pending) < PersistenceService.BUFFER_SIZE else 0
+            timer = threading.Timer(delay, PersistenceService.flush, args=(session_id,))
+            timer.daemon = True
+            PersistenceService._timers[session_id] = timer
+            timer.start()
+    
+    @staticmethod
+    def flush(session_id: str, durable: bool = False) -> None:
+        """
+        Append a session's buffered messages now, if there are any.
+        
+        Args:
+            session_id: Unique identifier for the session
+            durable: fsync the file after writing (auto-saves skip this; chat history isn't critical data)
+        """
+        with PersistenceService._write_lock:
+            messages = PersistenceService._take_pending(session_id)
+            if messages and session_id not in PersistenceService._deleted:
+                PersistenceService._append_records(session_id, messages, durable=durable)
+    
+    @staticmethod
+    def flush_all(durable: bool = False) -> None:
+        """
+        Write all buffered messages now.
+        
+        Args:
+            durable: fsync each file after writing (used for the exit flush)
+        """
+        with PersistenceService._pending_lock:
+            session_ids = list(PersistenceService._pending)
+        for session_id in session_ids:
+            PersistenceService.flush(session_id, durable=durable)
+    
+    @staticmethod
+    def _take_pending(session_id: str) -> Optional[List[Dict]]:
+        """Remove and return a session's buffered messages, cancelling its flush timer."""
+        with PersistenceService._pending_lock:
+            messages = PersistenceService._pending.pop(session_id, None)
+            timer = PersistenceService._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        return messages
+    
     @staticmethod
     def load_session(session_id: str) -> Optional[List[Dict]]:
         """
-        Load chat session from JSON file.
+        Load chat session from file (MessagePack, or JSON for older sessions).
+        
+        Decoded sessions are kept in a small in-memory LRU while their file is
+        unchanged, so a session restored again (e.g. in another browser tab)
+        isn't re-read from disk. Callers always get their own copy.
         
         Args:
             session_id: Unique identifier for the session
@@ -103,29 +210,38 @@ class PersistenceService:
             List of message dictionaries, or None if load failed
         """
         try:
-            filepath = os.path.join(PersistenceService.SESSIONS_DIR, f"{session_id}.json")
+            # Make sure buffered messages are on disk
+            PersistenceService.flush(session_id)
+            
+            filepath = PersistenceService._session_path(session_id)
+            if not os.path.exists(filepath):
+                filepath = PersistenceService._session_path(session_id, PersistenceService.LEGACY_SUFFIX)
             
             if not os.path.exists(filepath):
                 logger.warning(f"Session file not found: {session_id}")
                 return None
             
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            stat = os.stat(filepath)
+            file_key = (stat.st_mtime_ns, stat.st_size)
+            with PersistenceService._load_cache_lock:
+                cached = PersistenceService._load_cache.get(session_id)
+                if cached is not None and cached[0] == file_key:
+                    PersistenceService._load_cache.move_to_end(session_id)
+                    logger.info(f"Session loaded from memory: {session_id} ({len(cached[1])} messages)")
+                    return copy.deepcopy(cached[1])
             
+            data = PersistenceService._read_session_file(filepath)
             messages = data.get('messages', [])
             
-            # Convert base64 back to binary data
-            for msg in messages:
-                # Convert plots from base64 to bytes
-                if 'plots' in msg and msg['plots']:
-                    msg['plots'] = [
-                        base64.b64decode(plot) 
-                        for plot in msg['plots']
-                    ]
-                
-                # Convert image from base64 to bytes
-                if 'image' in msg and msg['image']:
-                    msg['image'] = base64.b64decode(msg['image'])
+            # Convert older single-document sessions (or repair a truncated log) so new messages can be appended
+            if not data.get('is_log'):
+                PersistenceService.save_session(session_id, messages)
+            else:
+                with PersistenceService._load_cache_lock:
+                    PersistenceService._load_cache[session_id] = (file_key, copy.deepcopy(messages))
+                    PersistenceService._load_cache.move_to_end(session_id)
+                    while len(PersistenceService._load_cache) > PersistenceService.LOAD_CACHE_SIZE:
+                        PersistenceService._load_cache.popitem(last=False)
             
             logger.info(f"Session loaded: {session_id} ({len(messages)} messages)")
             return messages
@@ -139,6 +255,10 @@ class PersistenceService:
         """
         Delete a chat session file.
         
+        Buffered messages for the session are dropped, and the session can't
+        be written again by this process (a flush already in progress finishes
+        before the file is removed).
+        
         Args:
             session_id: Unique identifier for the session
             
@@ -146,10 +266,20 @@ class PersistenceService:
             True if deletion was successful, False otherwise
         """
         try:
-            filepath = os.path.join(PersistenceService.SESSIONS_DIR, f"{session_id}.json")
+            with PersistenceService._write_lock:
+                with PersistenceService._pending_lock:
+                    PersistenceService._deleted.add(session_id)
+                PersistenceService._take_pending(session_id)
+                PersistenceService._forget_loaded(session_id)
+                deleted = False
+                for suffix in (PersistenceService.SESSION_SUFFIX, PersistenceService.LEGACY_SUFFIX):
+                    filepath = PersistenceService._session_path(session_id, suffix)
+                    if os.path.exists(filepath):
+                        os.remove(filepath)
+                        deleted = True
+                shutil.rmtree(PersistenceService._blob_dir(session_id), ignore_errors=True)
             
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            if deleted:
                 logger.info(f"Session deleted: {session_id}")
                 return True
             else:
@@ -170,18 +300,19 @@ class PersistenceService:
             cutoff_date = datetime.now() - timedelta(days=PersistenceService.MAX_SESSION_AGE_DAYS)
             deleted_count = 0
             
-            for filename in os.listdir(PersistenceService.SESSIONS_DIR):
-                if not filename.endswith('.json'):
-                    continue
-                
-                filepath = os.path.join(PersistenceService.SESSIONS_DIR, filename)
-                
-                # Check file modification time
-                file_mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
-                
-                if file_mtime < cutoff_date:
-                    os.remove(filepath)
-                    deleted_count += 1
+            # DirEntry gives the name and file type without extra lookups, and caches its stat()
+            with os.scandir(PersistenceService.SESSIONS_DIR) as entries:
+                for entry in entries:
+                    if not entry.name.endswith((PersistenceService.SESSION_SUFFIX, PersistenceService.LEGACY_SUFFIX)):
+                        continue
+                    
+                    # Check file modification time
+                    file_mtime = datetime.fromtimestamp(entry.stat().st_mtime)
+                    
+                    if file_mtime < cutoff_date:
+                        os.remove(entry.path)
+                        shutil.rmtree(os.path.splitext(entry.path)[0] + PersistenceService.BLOBS_SUFFIX, ignore_errors=True)
+                        deleted_count += 1
             
             if deleted_count > 0:
                 logger.info(f"Cleaned up {deleted_count} old session(s) older than {PersistenceService.MAX_SESSION_AGE_DAYS} days")
@@ -190,42 +321,265 @@ class PersistenceService:
             logger.error(f"Error during session cleanup: {str(e)}", exc_info=True)
     
     @staticmethod
-    def list_sessions() -> List[Dict]:
+    def list_sessions(limit: Optional[int] = None) -> List[Dict]:
         """
-        List all available sessions with metadata.
+        List available sessions with metadata, most recently active first.
+        
+        Session files are ordered by modification time before any is opened,
+        so with a limit only that many sessions are read (their messages are
+        counted, not decoded).
+        
+        Args:
+            limit: Maximum number of sessions to return (all if None)
         
         Returns:
-            List of session metadata dictionaries
+            List of session metadata dictionaries with 'session_id',
+            'created_at', 'updated_at' and 'message_count' keys
         """
         sessions = []
         
         try:
+            # Include messages still waiting in the write buffer
+            PersistenceService.flush_all()
+            
             if not os.path.exists(PersistenceService.SESSIONS_DIR):
                 return sessions
             
-            for filename in os.listdir(PersistenceService.SESSIONS_DIR):
-                if not filename.endswith('.json'):
-                    continue
-                
-                filepath = os.path.join(PersistenceService.SESSIONS_DIR, filename)
-                
+            with os.scandir(PersistenceService.SESSIONS_DIR) as entries:
+                session_files = [
+                    (entry.stat().st_mtime, entry.name, entry.path)
+                    for entry in entries
+                    if entry.name.endswith((PersistenceService.SESSION_SUFFIX, PersistenceService.LEGACY_SUFFIX))
+                ]
+            
+            # Sort by last update (most recently active first)
+            session_files.sort(reverse=True)
+            
+            for mtime, filename, filepath in session_files:
+                if limit is not None and len(sessions) >= limit:
+                    break
                 try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
+                    header = PersistenceService._read_session_header(filepath)
                     
                     sessions.append({
-                        'session_id': data.get('session_id', filename.replace('.json', '')),
-                        'created_at': data.get('created_at'),
-                        'message_count': data.get('message_count', 0)
+                        'session_id': header.get('session_id', os.path.splitext(filename)[0]),
+                        'created_at': header.get('created_at'),
+                        'updated_at': datetime.fromtimestamp(mtime).isoformat(),
+                        'message_count': header['message_count']
                     })
                 except Exception:
                     # Skip corrupted or invalid session files
                     continue
             
-            # Sort by creation time (newest first)
-            sessions.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
         except Exception as e:
             logger.error(f"Error listing sessions: {str(e)}", exc_info=True)
         
         return sessions
+    
+    @staticmethod
+    def _forget_loaded(session_id: str) -> None:
+        """Drop a session from the load cache."""
+        with PersistenceService._load_cache_lock:
+            PersistenceService._load_cache.pop(session_id, None)
+    
+    @staticmethod
+    def _session_path(session_id: str, suffix: str = SESSION_SUFFIX) -> str:
+        """Get the file path for a session ID."""
+        return os.path.join(PersistenceService.SESSIONS_DIR, f"{session_id}{suffix}")
+    
+    @staticmethod
+    def _blob_dir(session_id: str) -> str:
+        """Get the directory holding a session's plot and image blobs."""
+        return os.path.join(PersistenceService.SESSIONS_DIR, f"{session_id}{PersistenceService.BLOBS_SUFFIX}")
+    
+    @staticmethod
+    def _store_blob(blob_dir: str, data: bytes) -> str:
+        """Write bytes to the blob directory unless already there; returns their hash."""
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = os.path.join(blob_dir, digest)
+        if not os.path.exists(path):
+            os.makedirs(blob_dir, exist_ok=True)
+            # Write to a temp file first, so a crash never leaves a truncated blob under its hash
+            fd, temp_path = tempfile.mkstemp(dir=blob_dir, prefix=digest, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        return digest
+    
+    @staticmethod
+    def _prune_blobs(blob_dir: str, keep: Set[str]) -> None:
+        """Delete the blobs in a blob directory that aren't in keep."""
+        try:
+            with os.scandir(blob_dir) as entries:
+                for entry in entries:
+                    if entry.name not in keep:
+                        os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    
+    @staticmethod
+    def _load_blob(blob_dir: str, ref):
+        """Resolve a blob reference from a record (bytes from older files are returned as-is)."""
+        if not isinstance(ref, str):
+            return ref
+        try:
+            with open(os.path.join(blob_dir, ref), 'rb') as f:
+                return f.read()
+        except OSError:
+            logger.warning(f"Missing session blob: {ref}")
+            return None
+    
+    @staticmethod
+    def _to_record(blob_dir: str, message: Dict) -> Dict:
+        """Replace a message's plot and image bytes with blob references."""
+        record = dict(message)
+        if message.get('plots'):
+            record['plots'] = [PersistenceService._store_blob(blob_dir, plot) for plot in message['plots']]
+        if message.get('image'):
+            record['image'] = PersistenceService._store_blob(blob_dir, message['image'])
+        return record
+    
+    @staticmethod
+    def _from_record(blob_dir: str, record: Dict) -> Dict:
+        """Load the plot and image bytes referenced by a message record."""
+        if record.get('plots'):
+            plots = (PersistenceService._load_blob(blob_dir, ref) for ref in record['plots'])
+            record['plots'] = [plot for plot in plots if plot is not None]
+        if record.get('image'):
+            record['image'] = PersistenceService._load_blob(blob_dir, record['image'])
+        return record
+    
+    @staticmethod
+    def _iter_records(session_id: str, messages: List[Dict], with_header: bool,
+                      blob_refs: Optional[Set[str]] = None) -> Iterator[bytes]:
+        """
+        Encode messages (optionally preceded by the session header) as MessagePack records, one at a time.
+        
+        The hashes of the blobs the records reference are added to blob_refs, if given.
+        """
+        packer = msgpack.Packer(use_bin_type=True)
+        blob_dir = PersistenceService._blob_dir(session_id)
+        if with_header:
+            yield packer.pack({'session_id': session_id, 'created_at': datetime.now().isoformat()})
+        for message in messages:
+            record = PersistenceService._to_record(blob_dir, message)
+            if blob_refs is not None:
+                blob_refs.update(record.get('plots') or ())
+                if record.get('image'):
+                    blob_refs.add(record['image'])
+            yield packer.pack(record)
+    
+    @staticmethod
+    def _pack_records(session_id: str, messages: List[Dict], with_header: bool) -> bytes:
+        """Encode messages (optionally preceded by the session header) as one MessagePack buffer."""
+        return b''.join(PersistenceService._iter_records(session_id, messages, with_header))
+    
+    @staticmethod
+    def _append_records(session_id: str, messages: List[Dict], durable: bool = False) -> bool:
+        """
+        Append messages to a session file, creating it with a header if needed.
+        
+        Args:
+            session_id: Unique identifier for the session
+            messages: Message dictionaries to append
+            durable: fsync the file after writing
+            
+        Returns:
+            True if the write was successful, False otherwise
+        """
+        try:
+            filepath = PersistenceService._session_path(session_id)
+            is_new = not os.path.exists(filepath)
+            with open(filepath, 'ab') as f:
+                f.write(PersistenceService._pack_records(session_id, messages, with_header=is_new))
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            
+            logger.info(f"Session saved: {session_id} (+{len(messages)} messages)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error saving session {session_id}: {str(e)}", exc_info=True)
+            return False
+    
+    @staticmethod
+    def _read_session_header(filepath: str) -> Dict:
+        """
+        Read the metadata of a session file, with its 'message_count'.
+        
+        For a log, the header is decoded and the message records are only
+        counted (skipped without decoding); blobs are never read.
+        """
+        with open(filepath, 'rb') as f:
+            if f.read(1) != b'{':
+                f.seek(0)
+                unpacker = msgpack.Unpacker(f, raw=False, read_size=65536)
+                header = next(unpacker)
+                if 'messages' not in header:
+                    message_count = 0
+                    try:
+                        while True:
+                            unpacker.skip()
+                            message_count += 1
+                    except msgpack.OutOfData:
+                        pass
+                    return {**header, 'message_count': message_count}
+        
+        # Older single-document formats keep metadata alongside the messages
+        data = PersistenceService._read_session_file(filepath)
+        data['message_count'] = len(data.pop('messages', None) or [])
+        return data
+    
+    @staticmethod
+    def _read_session_file(filepath: str) -> Dict:
+        """
+        Read a session file in any of the supported formats.
+        
+        The format is detected from the first byte: JSON session files start
+        with '{' (a MessagePack map never does) and hold base64-encoded binary
+        data. A MessagePack file is a log (header, then one record per message)
+        unless its first record already contains the messages. Plots and
+        images referenced by hash are loaded from the session's blob directory.
+        
+        Args:
+            filepath: Path to the session file
+            
+        Returns:
+            Session dictionary with plots and images as bytes; 'is_log' is True
+            for an intact append-only log
+        """
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+        
+        if not raw.startswith(b'{'):
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(raw)
+            header, *messages = list(unpacker)
+            if 'messages' in header:
+                return header
+            blob_dir = os.path.splitext(filepath)[0] + PersistenceService.BLOBS_SUFFIX
+            messages = [PersistenceService._from_record(blob_dir, message) for message in messages]
+            # A record cut short by an interrupted write is not yielded; report the
+            # file as needing a rewrite so later appends don't follow the partial bytes
+            return {**header, 'messages': messages, 'is_log': unpacker.tell() == len(raw)}
+        
+        data = json.loads(raw)
+        # Convert base64 back to binary data (a2b_base64 directly, skipping b64decode's wrapper)
+        for msg in data.get('messages', []):
+            # Convert plots from base64 to bytes
+            if msg.get('plots'):
+                msg['plots'] = list(map(a2b_base64, msg['plots']))
+            
+            # Convert image from base64 to bytes
+            if msg.get('image'):
+                msg['image'] = a2b_base64(msg['image'])
+        return data
+
+
+# Don't lose buffered messages when the server shuts down
+atexit.register(PersistenceService.flush_all, durable=True)
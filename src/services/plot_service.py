@@ -41,16 +41,18 @@ class PlotService:
                 logger.debug("No content in candidate")
                 return plots
             
-            # Iterate through all parts in the response
+            # Iterate through all parts in the response (code execution can emit dozens)
+            plot_mime_types = AppConfig.PLOT_MIME_TYPES
             for part in candidate.content.parts:
                 # Check for inline_data (images)
-                if hasattr(part, 'inline_data') and part.inline_data:
-                    mime_type = part.inline_data.mime_type
+                inline_data = getattr(part, 'inline_data', None)
+                if inline_data:
+                    mime_type = inline_data.mime_type
                     
                     # Only process image types
-                    if mime_type in AppConfig.PLOT_MIME_TYPES:
+                    if mime_type in plot_mime_types:
                         plot = PlotData(
-                            image_data=part.inline_data.data,
+                            image_data=inline_data.data,
                             mime_type=mime_type
                         )
                         
@@ -92,7 +94,7 @@ class PlotService:
                 return False
             
             for part in candidate.content.parts:
-                if hasattr(part, 'executable_code') and part.executable_code:
+                if getattr(part, 'executable_code', None):
                     logger.debug("Response contains executable code")
                     return True
             
@@ -18,6 +18,16 @@ class PromptAnalyzer:
         'box plot', 'boxplot', 'draw', 'show me', 'create a'
     ]
     
+    # All keywords as one compiled alternation, so a prompt is scanned once
+    _KEYWORD_RE = re.compile('|'.join(re.escape(keyword) for keyword in PLOT_KEYWORDS))
+    
+    # Common visualization phrasings without a plot keyword
+    _VISUALIZATION_PATTERNS = [
+        re.compile(r'show.*\b(distribution|trend|comparison|correlation)\b'),
+        re.compile(r'compare.*\b(using|with|via)\b'),
+        re.compile(r'display.*\b(data|results|analysis)\b.*visually')
+    ]
+    
     @staticmethod
     def requires_plot(prompt: str) -> bool:
         """
@@ -39,21 +49,15 @@ class PromptAnalyzer:
         prompt_lower = prompt.lower()
         
         # Check for plot-related keywords
-        for keyword in PromptAnalyzer.PLOT_KEYWORDS:
-            if keyword in prompt_lower:
-                logger.info(f"Plot request detected - keyword: '{keyword}'")
-                return True
+        match = PromptAnalyzer._KEYWORD_RE.search(prompt_lower)
+        if match:
+            logger.info(f"Plot request detected - keyword: '{match.group(0)}'")
+            return True
         
         # Check for common visualization patterns
-        visualization_patterns = [
-            r'show.*\b(distribution|trend|comparison|correlation)\b',
-            r'compare.*\b(using|with|via)\b',
-            r'display.*\b(data|results|analysis)\b.*visually'
-        ]
-        
-        for pattern in visualization_patterns:
-            if re.search(pattern, prompt_lower):
-                logger.info(f"Plot request detected - pattern match: {pattern}")
+        for pattern in PromptAnalyzer._VISUALIZATION_PATTERNS:
+            if pattern.search(prompt_lower):
+                logger.info(f"Plot request detected - pattern match: {pattern.pattern}")
                 return True
         
         logger.debug("No plot request detected in prompt")
@@ -62,6 +62,30 @@ DO NOT show: "```python df.loc[df['Price'].idxmax()] ```"
 - Be concise but thorough - no fluff, just facts and insights
 - Present one accurate answer, not multiple attempts"""
 
+    # Static part of the file upload prompt (everything except the question).
+    # Also stored alongside the CSV in Gemini's context cache.
+    FILE_UPLOAD_CONTEXT = f"""{DATA_ANALYST_ROLE}
+
+The user has uploaded a CSV file (see above) and needs your help analyzing it.
+
+{DATA_ANALYSIS_INSTRUCTIONS}"""
+
+    # Full prompt text up to the user's question, assembled once at import
+    FILE_UPLOAD_PREFIX = f"""{FILE_UPLOAD_CONTEXT}
+
+User's question: """
+
+    PLOT_PREFIX = f"""{DATA_ANALYST_ROLE}
+
+VISUALIZATION REQUIREMENTS:
+- Write Python code using matplotlib or seaborn
+- Execute the code to generate the actual plot image
+- Provide a brief interpretation of what the plot shows
+
+{DATA_ANALYSIS_INSTRUCTIONS}
+
+User's request: """
+
     @staticmethod
     def get_file_upload_prompt(user_question: str) -> str:
         """
@@ -75,13 +99,23 @@ DO NOT show: "```python df.loc[df['Price'].idxmax()] ```"
         Returns:
             Complete prompt with role, instructions, and question
         """
-        return f"""{DataAnalystPrompts.DATA_ANALYST_ROLE}
-
-The user has uploaded a CSV file (see above) and needs your help analyzing it.
-
-{DataAnalystPrompts.DATA_ANALYSIS_INSTRUCTIONS}
-
-User's question: {user_question}"""
+        return DataAnalystPrompts.FILE_UPLOAD_PREFIX + user_question
+    
+    @staticmethod
+    def get_cached_file_prompt(user_question: str) -> str:
+        """
+        Generate prompt for CSV analysis when the file and instructions are cached.
+        
+        The CSV file and FILE_UPLOAD_CONTEXT already live in Gemini's context
+        cache, so only the question needs to be sent.
+        
+        Args:
+            user_question: The user's original question
+            
+        Returns:
+            Prompt containing only the question
+        """
+        return f"User's question: {user_question}"
     
     @staticmethod
     def get_plot_prompt(user_question: str) -> str:
@@ -96,14 +130,5 @@ User's question: {user_question}"""
         Returns:
             Complete prompt with plot generation instructions
         """
-        return f"""{DataAnalystPrompts.DATA_ANALYST_ROLE}
-
-VISUALIZATION REQUIREMENTS:
-- Write Python code using matplotlib or seaborn
-- Execute the code to generate the actual plot image
-- Provide a brief interpretation of what the plot shows
-
-{DataAnalystPrompts.DATA_ANALYSIS_INSTRUCTIONS}
-
-User's request: {user_question}"""
+        return DataAnalystPrompts.PLOT_PREFIX + user_question
 
@@ -0,0 +1,151 @@
+"""
+Cache for answers about an uploaded file (exact matches, optionally semantic).
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, Optional
+import numpy as np
+from ..models.constants import AppConfig
+from .embedding_service import EmbeddingService
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class SemanticResponseCache:
+    """
+    Reuses Gemini answers for questions already answered about the same file.
+    
+    By default a question only matches the same normalized text (case and
+    whitespace ignored) in the same namespace. Matching semantically
+    equivalent questions by embedding similarity is opt-in
+    (AppConfig.SEMANTIC_CACHE_ENABLED): questions that differ in one word
+    ("max" vs "min", "top 5" vs "top 10") can embed almost identically.
+    
+    Only answers that depend on nothing but the question and a namespace
+    (e.g. model + uploaded file) may be cached; chat answers that depend on
+    the conversation history must not be. Entries live in process memory,
+    shared by all sessions.
+    
+    With semantic matching, embeddings never delay an answer the cache can't
+    provide: a question is only embedded on lookup when its namespace
+    already holds embedded entries, and stored questions are embedded in the
+    background (until then they match exactly only).
+    """
+    
+    _embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache-embed")
+    
+    def __init__(self, threshold: float = AppConfig.SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = AppConfig.SEMANTIC_CACHE_MAX_ENTRIES,
+                 semantic: bool = AppConfig.SEMANTIC_CACHE_ENABLED):
+        """
+        Initialize an empty cache.
+        
+        Args:
+            threshold: Minimum cosine similarity between questions for a semantic hit
+            max_entries: Answers kept per namespace (least recently used are dropped)
+            semantic: Also match different questions whose embeddings reach threshold
+        """
+        self.threshold = threshold
+        self.semantic = semantic
+        self.max_entries = max_entries
+        # namespace -> {normalized question: (unit embedding or None while pending, response)}
+        self._entries: Dict[Hashable, OrderedDict] = {}
+        self._lock = threading.Lock()
+    
+    def lookup(self, namespace: Hashable, question: str) -> Optional[Any]:
+        """
+        Find the cached answer to the same (or, if enabled, a semantically equivalent) question.
+        
+        Args:
+            namespace: Key separating answers that aren't interchangeable
+            question: The user's question (without prompt instructions)
+            
+        Returns:
+            The cached response, or None on a miss
+        """
+        key = self._normalize(question)
+        with self._lock:
+            entries = self._entries.get(namespace)
+            if not entries:
+                return None
+            if key in entries:
+                entries.move_to_end(key)
+                logger.info(f"[CACHE] Response cache hit (exact): '{question[:60]}'")
+                return entries[key][1]
+            if not self.semantic:
+                return None
+            keys = [k for k, (embedding, _) in entries.items() if embedding is not None]
+            if not keys:
+                return None
+            matrix = np.stack([entries[k][0] for k in keys])
+        
+        query = self._embed(question)
+        if query is None:
+            return None
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        
+        with self._lock:
+            entry = entries.get(keys[best])
+            if entry is None:
+                return None  # Evicted meanwhile
+            entries.move_to_end(keys[best])
+        logger.info(f"[CACHE] Response cache hit (similarity {similarities[best]:.3f}): "
+                    f"'{question[:60]}' ~ '{keys[best][:60]}'")
+        return entry[1]
+    
+    def store(self, namespace: Hashable, question: str, response: Any) -> None:
+        """
+        Cache the answer to a question.
+        
+        The answer matches the same question right away; with semantic
+        matching it matches equivalent questions once the question has been
+        embedded in the background.
+        
+        Args:
+            namespace: Key separating answers that aren't interchangeable
+            question: The user's question (without prompt instructions)
+            response: The answer to return for this and equivalent questions
+        """
+        key = self._normalize(question)
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            entries[key] = (None, response)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        if self.semantic:
+            self._embed_executor.submit(self._add_embedding, namespace, key, question, response)
+    
+    def _add_embedding(self, namespace: Hashable, key: str, question: str, response: Any) -> None:
+        """Attach a question's embedding to its entry (runs off the script thread)."""
+        embedding = self._embed(question)
+        if embedding is None:
+            return
+        with self._lock:
+            entries = self._entries.get(namespace)
+            entry = entries.get(key) if entries else None
+            # Skip entries evicted or replaced while embedding
+            if entry is not None and entry[1] is response:
+                entries[key] = (embedding, response)
+    
+    @staticmethod
+    def _normalize(question: str) -> str:
+        """Key for exact matches, ignoring case and surrounding/repeated whitespace."""
+        return " ".join(question.lower().split())
+    
+    @staticmethod
+    def _embed(question: str) -> Optional[np.ndarray]:
+        """Embed a question as a unit vector; None if embeddings are unavailable."""
+        try:
+            vector = np.asarray(EmbeddingService.embed_texts([question])[0], dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"[CACHE] Response cache skipped, embedding failed: {str(e)}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
@@ -0,0 +1,83 @@
+"""
+Upload cache for images sent to Gemini.
+"""
+
+import hashlib
+import io
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+import streamlit as st
+from PIL import Image
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class UploadCache:
+    """
+    Maps image bytes to Gemini file uploads, so an image that stays attached
+    across turns is uploaded once and then referenced instead of re-sent inline.
+    """
+    
+    SESSION_KEY = "image_uploads"
+    MAX_ENTRIES = 64
+    # Gemini deletes uploaded files after 48 hours
+    FILE_TTL_SECONDS = 47 * 3600
+    
+    _upload_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gemini-image-upload")
+    
+    @staticmethod
+    def resolve(image_bytes: bytes, image: Image.Image):
+        """
+        Get what to send to Gemini for an image.
+        
+        The first time an image is seen it is sent inline while it uploads in
+        the background; later turns with the same bytes use the uploaded file.
+        
+        Args:
+            image_bytes: Encoded image data (used as the cache key)
+            image: The PIL Image, sent inline until the upload is ready
+        
+        Returns:
+            The uploaded file reference if available, otherwise the PIL Image
+        """
+        key = hashlib.blake2b(image_bytes, digest_size=16).digest()
+        cache = st.session_state.setdefault(UploadCache.SESSION_KEY, OrderedDict())
+        
+        entry = cache.get(key)
+        if entry is not None:
+            future, uploaded_at = entry
+            if not future.done():
+                return image
+            if future.result() is not None and time.time() - uploaded_at < UploadCache.FILE_TTL_SECONDS:
+                cache.move_to_end(key)
+                logger.info(f"[UPLOAD] Using cached image upload: {future.result().name}")
+                return future.result()
+        
+        # New, failed or expired upload - start one for the next turn
+        mime_type = Image.MIME.get(image.format or 'PNG', 'image/png')
+        cache[key] = (UploadCache._upload_executor.submit(UploadCache._upload, image_bytes, mime_type), time.time())
+        cache.move_to_end(key)
+        while len(cache) > UploadCache.MAX_ENTRIES:
+            cache.popitem(last=False)
+        return image
+    
+    @staticmethod
+    def clear() -> None:
+        """Forget all cached uploads for this session."""
+        st.session_state.pop(UploadCache.SESSION_KEY, None)
+    
+    @staticmethod
+    def _upload(image_bytes: bytes, mime_type: str):
+        """Upload image bytes to Gemini. Runs off the script thread; returns None on failure."""
+        try:
+            upload_start = time.time()
+            uploaded_file = genai.upload_file(io.BytesIO(image_bytes), mime_type=mime_type)
+            logger.info(f"[UPLOAD] Image uploaded in {time.time() - upload_start:.2f}s "
+                        f"({len(image_bytes) / 1024:.0f} KB, file: {uploaded_file.name})")
+            return uploaded_file
+        except Exception as e:
+            logger.warning(f"[UPLOAD] Image upload failed, image will be sent inline: {str(e)}")
+            return None
@@ -2,6 +2,7 @@
 Chat UI component.
 """
 
+import time
 import streamlit as st
 from typing import List, Dict
 from ..models.constants import MessageRole, AppConfig
@@ -43,10 +44,10 @@ class ChatUI:
                 
                 st.markdown(message["content"])
                 
-                # Display plots if any are attached to this message (for assistant responses)
+                # Display plots if any are attached to this message (for assistant responses),
+                # all in one element
                 if "plots" in message and message["plots"]:
-                    for plot_data in message["plots"]:
-                        st.image(plot_data, width='stretch')
+                    st.image(message["plots"], width='stretch')
                 
                 # Display timestamp if available and enabled
                 if show_timestamps and "timestamp" in message and message["timestamp"]:
@@ -63,34 +64,68 @@ class ChatUI:
         return st.chat_input(AppConfig.DEFAULT_PROMPT)
     
     @staticmethod
-    def display_message(role: str, content: str, timestamp: str = None) -> None:
+    def display_message(role: str, content: str, timestamp: str = None, image=None):
         """
-        Display a single message with optional timestamp.
+        Display a single message with optional image and timestamp.
         
         Args:
             role: The role of the message sender
             content: The content to display
             timestamp: Optional timestamp to display
+            image: Optional image (PIL Image or bytes) to display with the message
+            
+        Returns:
+            The chat message container, so more content can be added to it later
         """
         show_timestamps = st.session_state.get("show_timestamps", True)
         
-        with st.chat_message(role):
+        message_container = st.chat_message(role)
+        with message_container:
+            if image is not None:
+                st.image(image, caption="Uploaded Image", width='stretch')
             st.markdown(content)
             if show_timestamps and timestamp:
                 st.caption(f"🕐 {timestamp}")
+        return message_container
     
     @staticmethod
     def display_streaming_response(response_generator) -> str:
         """
         Display a streaming response from the AI.
         
+        A thinking indicator is shown until the first chunk arrives.
+        Chunks are buffered and the message is redrawn at most once per
+        AppConfig.STREAM_RENDER_INTERVAL seconds, so long replies don't
+        send one UI update per chunk. In-progress text is shown as plain
+        text; markdown is parsed only once, for the complete response.
+        
         Args:
             response_generator: Generator yielding response chunks
             
         Returns:
             The complete response text
         """
-        return st.write_stream(response_generator)
+        placeholder = st.empty()
+        placeholder.markdown(f"⏳ {AppConfig.THINKING_MESSAGE}")
+        chunks = []
+        last_render = 0.0
+        
+        try:
+            for chunk in response_generator:
+                chunks.append(chunk)
+                now = time.monotonic()
+                if now - last_render >= AppConfig.STREAM_RENDER_INTERVAL:
+                    placeholder.text("".join(chunks))
+                    last_render = now
+        except Exception:
+            # Don't leave the thinking indicator behind if nothing was streamed
+            if not chunks:
+                placeholder.empty()
+            raise
+        
+        full_response = "".join(chunks)
+        placeholder.markdown(full_response)
+        return full_response
     
     @staticmethod
     def display_error(error_message: str) -> None:
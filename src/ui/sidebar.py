@@ -2,15 +2,74 @@
 Sidebar UI component.
 """
 
+import io
 import streamlit as st
 from PIL import Image
+from ..models.constants import AppConfig
 from ..services.chat_history import ChatHistoryManager
 from ..services.csv_service import CSVService
 
 
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _decode_image(file_id: str, _data: bytes) -> Image.Image:
+    """
+    Decode an uploaded image once, downscaled to at most IMAGE_MAX_SIDE pixels per side.
+    
+    file_id is unique per upload, so the bytes themselves aren't hashed.
+    """
+    image = Image.open(io.BytesIO(_data))
+    # thumbnail() keeps the aspect ratio and format, and lets JPEGs decode at reduced size
+    image.thumbnail((AppConfig.IMAGE_MAX_SIDE, AppConfig.IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+    image.load()
+    return image
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _preview_image(file_id: str, _image: Image.Image) -> bytes:
+    """
+    Encode a sidebar-sized preview of an uploaded image once per upload.
+    
+    Returns:
+        The preview, as JPEG for JPEG uploads and PNG otherwise
+    """
+    preview = _image.copy()
+    preview.thumbnail((AppConfig.IMAGE_PREVIEW_SIDE, AppConfig.IMAGE_PREVIEW_SIDE), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    preview.save(buffer, format='JPEG' if _image.format == 'JPEG' else 'PNG')
+    return buffer.getvalue()
+
+
 class SidebarUI:
     """Handles sidebar UI components."""
     
+    # Static sidebar text (markdown is rendered by the browser)
+    ABOUT_MD = """\
+This chatbot uses Google's Gemini AI model to have intelligent conversations.
+
+**Features:**
+- 💬 Multi-turn conversations
+- 📝 Streaming responses
+- 💾 Chat history persistence
+- 🧠 Context-aware responses
+- 🖼️ Image analysis with vision AI
+- 📊 CSV data analysis with file upload API
+- 📤 **Supports files up to 2GB** (CSV & images)
+- 🚀 No token usage for CSV data
+- ⏱️ Message timestamps
+- 📋 Comprehensive logging
+
+**Coming Soon:**
+- 📎 Multiple file uploads
+- 💾 Export chat history
+"""
+    
+    TIPS_MD = """\
+- Ask follow-up questions naturally
+- Reference previous messages in the conversation
+- Clear chat to start fresh
+- Try creative prompts!
+"""
+    
     @staticmethod
     def render(message_count: int) -> None:
         """
@@ -42,12 +101,9 @@ class SidebarUI:
         st.divider()
         
         # Show timestamps toggle
-        if "show_timestamps" not in st.session_state:
-            st.session_state.show_timestamps = True
-        
         st.session_state.show_timestamps = st.toggle(
             "🕐 Show Timestamps",
-            value=st.session_state.show_timestamps,
+            value=st.session_state.setdefault("show_timestamps", True),
             help="Display when each message was sent"
         )
         
@@ -60,8 +116,15 @@ class SidebarUI:
         st.info(f"💬 Messages in history: {message_count}")
     
     @staticmethod
+    @st.fragment
     def _render_image_upload() -> None:
-        """Render the image upload section."""
+        """
+        Render the image upload section.
+        
+        This is a fragment: choosing or removing an image reruns only this
+        section, not the chat. The image is read from session state when the
+        next message is sent.
+        """
         st.subheader("🖼️ Image Upload")
         
         uploaded_file = st.file_uploader(
@@ -72,85 +135,84 @@ class SidebarUI:
         )
         
         if uploaded_file is not None:
-            # Convert uploaded file to PIL Image and store in session state
-            image = Image.open(uploaded_file)
+            # Convert uploaded file to PIL Image (decoded once per upload, not on every rerun)
+            image = _decode_image(uploaded_file.file_id, uploaded_file.getvalue())
             st.session_state['uploaded_image'] = image
             
-            # Display preview
-            st.image(image, caption="Uploaded Image", width='stretch')
+            # Display a small preview, encoded once, so reruns don't re-encode or resend the full image
+            st.image(_preview_image(uploaded_file.file_id, image), caption="Uploaded Image", width='stretch')
             
             # Show remove button
             if st.button("❌ Remove Image", width='stretch', key="remove_image_button"):
                 # Clear both the session state and force file uploader to reset
-                if 'uploaded_image' in st.session_state:
-                    del st.session_state['uploaded_image']
+                st.session_state.pop('uploaded_image', None)
                 # Clear the file uploader by deleting its key
-                if 'image_file_uploader' in st.session_state:
-                    del st.session_state['image_file_uploader']
-                st.rerun()
-        elif 'uploaded_image' in st.session_state:
+                st.session_state.pop('image_file_uploader', None)
+                st.rerun(scope="fragment")
+        else:
             # File uploader was cleared, remove from session state
-            del st.session_state['uploaded_image']
+            st.session_state.pop('uploaded_image', None)
     
     @staticmethod
+    @st.fragment
     def _render_csv_upload() -> None:
-        """Render the CSV upload section."""
-        st.subheader("📊 CSV Data Upload")
-        
-        # File uploader for CSV
-        uploaded_csv = st.file_uploader(
-            "Upload a CSV file",
-            type=['csv'],
-            help="Upload a CSV file to analyze with AI. Supports files up to 2GB using file upload API!",
-            key="csv_file_uploader"
-        )
+        """
+        Render the CSV upload section.
         
-        # URL input for CSV
-        csv_url = st.text_input(
-            "Or enter CSV URL",
-            placeholder="https://example.com/data.csv",
-            help="Provide a direct URL to a CSV file. Supports large files up to 2GB!",
-            key="csv_url_input"
-        )
+        This is a fragment, and the file picker, URL and Load button are a
+        form, so picking a file or typing a URL doesn't rerun anything.
+        Loading or removing a CSV reruns the whole app.
+        """
+        st.subheader("📊 CSV Data Upload")
         
-        # Load button
-        load_clicked = st.button("📥 Load CSV", width='stretch', key="load_csv_button")
+        with st.form("csv_upload_form", border=False):
+            # File uploader for CSV
+            uploaded_csv = st.file_uploader(
+                "Upload a CSV file",
+                type=['csv'],
+                help="Upload a CSV file to analyze with AI. Supports files up to 2GB using file upload API!",
+                key="csv_file_uploader"
+            )
+            
+            # URL input for CSV
+            csv_url = st.text_input(
+                "Or enter CSV URL",
+                placeholder="https://example.com/data.csv",
+                help="Provide a direct URL to a CSV file. Supports large files up to 2GB!",
+                key="csv_url_input"
+            )
+            
+            # Load button
+            load_clicked = st.form_submit_button("📥 Load CSV", width='stretch', key="load_csv_button")
         
         # Handle CSV loading
         if load_clicked:
             # Priority: uploaded file first, then URL
             if uploaded_csv is not None:
-                df = CSVService.load_csv(uploaded_csv)
+                with st.spinner("📥 Loading CSV..."):
+                    df = CSVService.load_csv(uploaded_csv)
                 if df is not None:
-                    st.session_state['df'] = df
-                    st.session_state['csv_changed'] = True  # Mark as changed for re-upload
-                    # Clear any existing uploaded file reference
-                    if 'uploaded_csv_file' in st.session_state:
-                        del st.session_state['uploaded_csv_file']
+                    SidebarUI._store_loaded_csv(df)
                     st.rerun()
             elif csv_url.strip():
-                df = CSVService.load_csv(csv_url)
+                with st.spinner("📥 Downloading and loading CSV..."):
+                    df = CSVService.load_csv(csv_url)
                 if df is not None:
-                    st.session_state['df'] = df
-                    st.session_state['csv_changed'] = True  # Mark as changed for re-upload
-                    # Clear any existing uploaded file reference
-                    if 'uploaded_csv_file' in st.session_state:
-                        del st.session_state['uploaded_csv_file']
+                    SidebarUI._store_loaded_csv(df)
                     st.rerun()
             else:
                 st.warning("⚠️ Please upload a file or enter a URL first")
         
         # Display loaded CSV info
-        if 'df' in st.session_state and st.session_state['df'] is not None:
+        df = st.session_state.get('df')
+        if df is not None:
             st.success("✅ CSV Loaded!")
             
-            df = st.session_state['df']
-            
             # Show summary
             st.caption(f"**{df.shape[0]:,}** rows × **{df.shape[1]}** columns")
             
-            # Show token estimation
-            estimated_tokens = CSVService.estimate_csv_tokens(df)
+            # Show token estimation (cached per DataFrame content, not recomputed on every rerun)
+            estimated_tokens = CSVService.get_token_estimate(df, CSVService.get_session_fingerprint(df))
             max_tokens = 1_000_000
             token_percentage = (estimated_tokens / max_tokens) * 100
             
@@ -179,45 +241,46 @@ class SidebarUI:
             
             # Remove CSV button
             if st.button("❌ Remove CSV", width='stretch', key="remove_csv_button"):
-                if 'df' in st.session_state:
-                    del st.session_state['df']
-                if 'uploaded_csv_file' in st.session_state:
-                    del st.session_state['uploaded_csv_file']
-                if 'csv_changed' in st.session_state:
-                    del st.session_state['csv_changed']
+                for key in ('df', 'df_fp', 'uploaded_csv_file', 'uploaded_csv_hash',
+                            'csv_cache_name', 'csv_cache_hash', 'csv_cache_expires',
+                            'csv_tokens', 'csv_tokens_hash', 'df_bytes', 'df_bytes_hash',
+                            'upload_future', 'upload_future_hash'):
+                    st.session_state.pop(key, None)
                 st.rerun()
     
+    @staticmethod
+    def _store_loaded_csv(df) -> None:
+        """
+        Store a newly loaded DataFrame and start uploading it to Gemini.
+        
+        The upload runs in the background so it is usually finished by the
+        time the first question is asked. CSVs over the token limit are not
+        prefetched; the chat input rejects them before uploading.
+        
+        Args:
+            df: The loaded DataFrame
+        """
+        fingerprint = CSVService.compute_fingerprint(df)
+        st.session_state['df'] = df
+        st.session_state['df_fp'] = fingerprint
+        
+        if st.session_state.get('uploaded_csv_hash') == fingerprint:
+            return  # Same data is already on Gemini
+        
+        # The estimate only samples rows; the full CSV is rendered once, by the background upload
+        csv_tokens = CSVService.get_token_estimate(df, fingerprint)
+        if CSVService.validate_token_limit(df, csv_tokens=csv_tokens)['is_valid']:
+            st.session_state['upload_future'] = CSVService.upload_csv_to_gemini_async(df)
+            st.session_state['upload_future_hash'] = fingerprint
+    
     @staticmethod
     def _render_about() -> None:
         """Render the about section."""
         st.header("ℹ️ About")
-        st.markdown("""
-        This chatbot uses Google's Gemini AI model to have intelligent conversations.
-        
-        **Features:**
-        - 💬 Multi-turn conversations
-        - 📝 Streaming responses
-        - 💾 Chat history persistence
-        - 🧠 Context-aware responses
-        - 🖼️ Image analysis with vision AI
-        - 📊 CSV data analysis with file upload API
-        - 📤 **Supports files up to 2GB** (CSV & images)
-        - 🚀 No token usage for CSV data
-        - ⏱️ Message timestamps
-        - 📋 Comprehensive logging
-        
-        **Coming Soon:**
-        - 📎 Multiple file uploads
-        - 💾 Export chat history
-        """)
+        st.markdown(SidebarUI.ABOUT_MD)
     
     @staticmethod
     def _render_tips() -> None:
         """Render the tips section."""
         st.header("💡 Tips")
-        st.markdown("""
-        - Ask follow-up questions naturally
-        - Reference previous messages in the conversation
-        - Clear chat to start fresh
-        - Try creative prompts!
-        """)
+        st.markdown(SidebarUI.TIPS_MD)
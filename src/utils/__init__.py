@@ -0,0 +1 @@
+"""Package initialization files for subdirectories."""
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+JSON loading for chat sessions saved in the older JSON format.
+
+Uses orjson when it is installed and falls back to the standard library.
+"""
+
+import json as _json
+from typing import Any, Union
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Deserialize a JSON document.
+    
+    Args:
+        data: JSON document as bytes or str
+        
+    Returns:
+        The deserialized object
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return _json.loads(data)
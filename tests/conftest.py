@@ -0,0 +1,29 @@
+"""
+Shared test fixtures.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+import pytest
+
+# config.py requires an API key at import time; tests never call Gemini
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.persistence_service import PersistenceService  # noqa: E402
+
+
+@pytest.fixture
+def sessions_dir(tmp_path, monkeypatch):
+    """Point PersistenceService at an empty directory, with fresh buffers and caches."""
+    path = tmp_path / "chat_sessions"
+    monkeypatch.setattr(PersistenceService, "SESSIONS_DIR", str(path))
+    monkeypatch.setattr(PersistenceService, "_pending", {})
+    monkeypatch.setattr(PersistenceService, "_timers", {})
+    monkeypatch.setattr(PersistenceService, "_deleted", set())
+    monkeypatch.setattr(PersistenceService, "_load_cache", OrderedDict())
+    PersistenceService.initialize()
+    yield path
+    # Write (into this directory) anything a test left buffered, before the patches are undone
+    PersistenceService.flush_all()
@@ -0,0 +1,62 @@
+"""
+Tests for the chat history cap.
+"""
+
+import types
+import pytest
+from src.models.constants import AppConfig
+from src.services import chat_history
+from src.services.chat_history import ChatHistoryManager
+from src.services.persistence_service import PersistenceService
+
+
+@pytest.fixture
+def session_state(sessions_dir, monkeypatch):
+    """Run ChatHistoryManager against a plain dict instead of Streamlit's session state."""
+    state = {}
+    monkeypatch.setattr(chat_history, "st", types.SimpleNamespace(session_state=state))
+    monkeypatch.setattr(AppConfig, "MAX_HISTORY_MESSAGES", 10)
+    return state
+
+
+def _exchange(count):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": str(i), "timestamp": "t", "plots": [], "image": None}
+        for i in range(count)
+    ]
+
+
+def test_history_cap_applies_on_reload(session_state, sessions_dir):
+    PersistenceService.save_session("20990101_000000_000000", _exchange(30))
+    
+    ChatHistoryManager.initialize()
+    
+    messages = session_state[ChatHistoryManager.SESSION_KEY]
+    assert [m["content"] for m in messages] == [str(i) for i in range(20, 30)]
+    assert len(session_state[ChatHistoryManager.SESSION_KEY_GEMINI]) == 10
+    # The session file is rewritten with only the kept messages
+    assert len(PersistenceService.load_session("20990101_000000_000000")) == 10
+
+
+def test_history_cap_keeps_a_user_message_first(session_state):
+    ChatHistoryManager.initialize()
+    for i in range(11):
+        ChatHistoryManager.add_message("user" if i % 2 == 0 else "assistant", str(i))
+    ChatHistoryManager.add_message("assistant", "11")
+    
+    messages = ChatHistoryManager.get_messages()
+    assert len(messages) <= 10
+    assert messages[0]["role"] == "user"
+    assert len(ChatHistoryManager.get_gemini_messages()) == len(messages)
+
+
+def test_session_log_stays_bounded(session_state):
+    ChatHistoryManager.initialize()
+    for i in range(60):
+        ChatHistoryManager.add_message("user" if i % 2 == 0 else "assistant", str(i))
+    session_id = session_state[ChatHistoryManager.SESSION_ID_KEY]
+    PersistenceService.flush(session_id)
+    
+    saved = PersistenceService.load_session(session_id)
+    assert len(saved) < 2 * AppConfig.MAX_HISTORY_MESSAGES
+    assert saved[-len(ChatHistoryManager.get_messages()):] == ChatHistoryManager.get_messages()
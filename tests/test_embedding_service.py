@@ -0,0 +1,24 @@
+"""
+Tests for the text embedding cache.
+"""
+
+from collections import OrderedDict
+import google.generativeai as genai
+from src.services.embedding_service import EmbeddingService
+
+
+def test_cache_misses_are_embedded_in_one_request(monkeypatch):
+    requests = []
+    
+    def fake_embed_content(model, content):
+        requests.append(list(content))
+        return {"embedding": [[float(len(text))] for text in content]}
+    
+    monkeypatch.setattr(EmbeddingService, "_cache", OrderedDict())
+    monkeypatch.setattr(genai, "embed_content", fake_embed_content)
+    
+    assert EmbeddingService.embed_texts(["a", "bb", "a"]) == [[1.0], [2.0], [1.0]]
+    assert EmbeddingService.embed_texts(["bb", "ccc"]) == [[2.0], [3.0]]
+    assert EmbeddingService.embed_texts(["ccc", "a"]) == [[3.0], [1.0]]
+    
+    assert requests == [["a", "bb"], ["ccc"]]
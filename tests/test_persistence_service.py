@@ -0,0 +1,163 @@
+"""
+Tests for the append-only session log.
+"""
+
+import base64
+import json
+import threading
+import time
+import pytest
+from src.services.persistence_service import PersistenceService
+
+
+def _message(content, role="user", plots=None, image=None):
+    return {"role": role, "content": content, "timestamp": "12:00:00", "plots": plots or [], "image": image}
+
+
+def test_append_then_load_round_trip(sessions_dir):
+    messages = [
+        _message("hello"),
+        _message("a plot", role="assistant", plots=[b"\x89PNG one", b"\x89PNG two"]),
+        _message("with image", image=b"\xff\xd8 jpeg"),
+    ]
+    for message in messages:
+        PersistenceService.append_message("s1", message)
+    PersistenceService.flush("s1")
+    
+    assert PersistenceService.load_session("s1") == messages
+    # Plot and image bytes live in the blob directory, not in the log
+    assert b"\x89PNG one" not in (sessions_dir / "s1.msgpack").read_bytes()
+    assert len(list((sessions_dir / "s1.blobs").iterdir())) == 3
+
+
+def test_load_session_reads_buffered_messages(sessions_dir):
+    PersistenceService.append_message("s1", _message("first"))
+    PersistenceService.flush("s1")
+    PersistenceService.append_message("s1", _message("still buffered"))
+    
+    assert [m["content"] for m in PersistenceService.load_session("s1")] == ["first", "still buffered"]
+
+
+def test_load_legacy_json_session(sessions_dir):
+    legacy = {
+        "session_id": "old",
+        "created_at": "2024-01-01T00:00:00",
+        "message_count": 2,
+        "messages": [
+            {"role": "user", "content": "q", "timestamp": "t", "plots": [], "image": base64.b64encode(b"img").decode()},
+            {"role": "assistant", "content": "a", "timestamp": "t", "plots": [base64.b64encode(b"plot").decode()], "image": None},
+        ],
+    }
+    (sessions_dir / "old.json").write_text(json.dumps(legacy))
+    
+    messages = PersistenceService.load_session("old")
+    
+    assert messages[0]["image"] == b"img"
+    assert messages[1]["plots"] == [b"plot"]
+    # Converted to a log that new messages can be appended to
+    assert not (sessions_dir / "old.json").exists()
+    PersistenceService.append_message("old", _message("new"))
+    PersistenceService.flush("old")
+    assert [m["content"] for m in PersistenceService.load_session("old")] == ["q", "a", "new"]
+
+
+def test_truncated_log_is_repaired(sessions_dir):
+    PersistenceService.append_message("s1", _message("kept"))
+    PersistenceService.append_message("s1", _message("cut short"))
+    PersistenceService.flush("s1")
+    path = sessions_dir / "s1.msgpack"
+    path.write_bytes(path.read_bytes()[:-3])
+    
+    assert [m["content"] for m in PersistenceService.load_session("s1")] == ["kept"]
+    PersistenceService.append_message("s1", _message("after repair"))
+    PersistenceService.flush("s1")
+    assert [m["content"] for m in PersistenceService.load_session("s1")] == ["kept", "after repair"]
+
+
+def test_concurrent_flushes_keep_message_order(sessions_dir):
+    for i in range(50):
+        PersistenceService.append_message("s1", _message(str(i)))
+        if i % 5 == 0:
+            threads = [threading.Thread(target=PersistenceService.flush_all) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    PersistenceService.flush("s1")
+    
+    assert [m["content"] for m in PersistenceService.load_session("s1")] == [str(i) for i in range(50)]
+
+
+def test_delete_drops_pending_messages(sessions_dir, monkeypatch):
+    monkeypatch.setattr(PersistenceService, "FLUSH_INTERVAL", 0.05)
+    PersistenceService.append_message("s1", _message("written"))
+    PersistenceService.flush("s1")
+    PersistenceService.append_message("s1", _message("pending"))
+    
+    assert PersistenceService.delete_session("s1")
+    time.sleep(0.2)  # Past the flush timer
+    PersistenceService.flush_all()
+    PersistenceService.append_message("s1", _message("late"))
+    PersistenceService.flush("s1")
+    
+    assert not (sessions_dir / "s1.msgpack").exists()
+    assert not (sessions_dir / "s1.blobs").exists()
+
+
+def test_delete_waits_for_a_flush_in_progress(sessions_dir, monkeypatch):
+    # A flush that already took its batch must not recreate the file after the delete
+    writing = threading.Event()
+    release = threading.Event()
+    append_records = PersistenceService._append_records
+    
+    def slow_append(session_id, messages, durable=False):
+        writing.set()
+        release.wait(5)
+        return append_records(session_id, messages, durable=durable)
+    
+    monkeypatch.setattr(PersistenceService, "_append_records", staticmethod(slow_append))
+    PersistenceService.append_message("s1", _message("in flight"))
+    flusher = threading.Thread(target=PersistenceService.flush, args=("s1",))
+    flusher.start()
+    assert writing.wait(5)
+    deleter = threading.Thread(target=PersistenceService.delete_session, args=("s1",))
+    deleter.start()
+    release.set()
+    flusher.join()
+    deleter.join()
+    
+    assert not (sessions_dir / "s1.msgpack").exists()
+    assert PersistenceService.list_sessions() == []
+
+
+def test_list_sessions_newest_first_with_message_count(sessions_dir):
+    PersistenceService.save_session("older", [_message("a"), _message("b", role="assistant")])
+    time.sleep(0.01)
+    PersistenceService.append_message("newer", _message("c"))
+    PersistenceService.flush("newer")
+    
+    sessions = PersistenceService.list_sessions()
+    
+    assert [(s["session_id"], s["message_count"]) for s in sessions] == [("newer", 1), ("older", 2)]
+    assert [s["session_id"] for s in PersistenceService.list_sessions(limit=1)] == ["newer"]
+
+
+def test_save_session_removes_unreferenced_blobs(sessions_dir):
+    PersistenceService.save_session("s1", [_message("old", plots=[b"old plot"]), _message("kept", plots=[b"kept plot"])])
+    PersistenceService.save_session("s1", [_message("kept", plots=[b"kept plot"])])
+    
+    assert len(list((sessions_dir / "s1.blobs").iterdir())) == 1
+    assert PersistenceService.load_session("s1")[0]["plots"] == [b"kept plot"]
+
+
+def test_failed_blob_write_leaves_no_partial_blob(sessions_dir, monkeypatch):
+    blob_dir = sessions_dir / "s1.blobs"
+    
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr("os.replace", failing_replace)
+    with pytest.raises(OSError):
+        PersistenceService._store_blob(str(blob_dir), b"\x89PNG data")
+    
+    assert list(blob_dir.iterdir()) == []
@@ -0,0 +1,31 @@
+"""
+Tests for the uploaded-file response cache.
+"""
+
+from src.services.response_cache import SemanticResponseCache
+
+
+def test_exact_match_ignores_case_and_whitespace():
+    cache = SemanticResponseCache()
+    cache.store(("model", "files/a", "stream"), "Max of sales?", "42")
+    
+    assert cache.lookup(("model", "files/a", "stream"), "  max of   SALES? ") == "42"
+
+
+def test_different_questions_and_files_do_not_match():
+    cache = SemanticResponseCache()
+    cache.store(("model", "files/a", "stream"), "max of sales", "42")
+    
+    # Semantic matching is off by default, so near-identical wording is a miss
+    assert cache.lookup(("model", "files/a", "stream"), "min of sales") is None
+    assert cache.lookup(("model", "files/b", "stream"), "max of sales") is None
+
+
+def test_least_recently_used_answers_are_dropped():
+    cache = SemanticResponseCache(max_entries=2)
+    namespace = ("model", "files/a", "stream")
+    for question in ("q1", "q2", "q3"):
+        cache.store(namespace, question, question.upper())
+    
+    assert cache.lookup(namespace, "q1") is None
+    assert cache.lookup(namespace, "q3") == "Q3"